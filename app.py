@@ -1,15 +1,23 @@
 import os
 from flask import Flask, redirect, url_for
 from flask_wtf import CSRFProtect
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 
-from models import init_db, create_user, close_db, load_user, get_db
+from models import (
+    init_db, close_db, load_user, seed_default_users, remember_write, current_tenant_id, list_tenants, PoolExhausted
+)
+from profiling import init_profiling
+from audit import init_audit
+from throttle import init_throttle
+from commands import register_commands
 
 # Import Blueprints
 from routes.auth import auth
 from routes.dashboard import dashboard
 from routes.expenses import expenses_bp
 from routes.admin import admin_bp
+from routes.periods import periods_bp
+from routes.tenants import tenants_bp
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY") or 'fallback_secret_key'
@@ -37,43 +45,55 @@ def _load_user(user_id):
     return load_user(user_id)
 
 
+@app.context_processor
+def _branch_context():
+    # Branch name for the navbar (and the switcher list for admins)
+    if not current_user.is_authenticated:
+        return {}
+    branches = list_tenants()
+    tenant_id = current_tenant_id()
+    current = next((b["name"] for b in branches if b["id"] == tenant_id), "")
+    return {"branches": branches, "current_branch": current, "current_branch_id": tenant_id}
+
+
+@app.errorhandler(PoolExhausted)
+def _pool_exhausted(e):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT; tell clients to retry
+    app.logger.warning("Database pool exhausted: %s", e)
+    return "The server is busy. Please try again in a moment.", 503, {"Retry-After": "5"}
+
+
 # Register Blueprints
 app.register_blueprint(auth)
 app.register_blueprint(dashboard)
 app.register_blueprint(expenses_bp)
 app.register_blueprint(admin_bp)
+app.register_blueprint(periods_bp)
+app.register_blueprint(tenants_bp)
 
 # Close DB connections on app context teardown
 app.teardown_appcontext(close_db)
 
-# Initialize database
-init_db()
+# Pages read after a write stay on the primary for a while (see models.get_read_db)
+app.after_request(remember_write)
 
+# Opt-in request profiling (no-op unless PROFILING_ENABLED=1)
+init_profiling(app)
 
-# -----------------------
-# Idempotent default user seeding
-# -----------------------
-def seed_default_users():
-    created = []
+# Write-behind audit trail (AUDIT_ENABLED=0 turns it off)
+init_audit(app)
 
-    defaults = [
-        ("Admin", "admin@church.com", "password123", "admin"),
-        ("John Usher", "usher@church.com", "password123", "usher"),
-        ("Mary Finance", "finance@church.com", "password123", "finance"),
-        ("Pastor Paul", "pastor@church.com", "password123", "pastor")
-    ]
+# Per-IP and per-account login throttling (LOGIN_THROTTLE_ENABLED=0 turns it off)
+init_throttle(app)
 
-    for name, email, password, role in defaults:
-        from models import get_user_by_email, create_user
-        if not get_user_by_email(email):
-            create_user(name, email, password, role)
-            created.append(email)
+# Management CLI (flask --app app users|members|export ...)
+register_commands(app)
 
-    if created:
-        print(f"Created default users: {', '.join(created)}")
-    else:
-        print("All default users already exist.")
+# Default user seeding can be turned off entirely, e.g. SKIP_SEED=1 in production
+app.config.setdefault("SKIP_SEED", os.environ.get("SKIP_SEED") == "1")
 
+# Initialize database
+init_db()
 
 
 @app.route("/")
@@ -87,11 +107,12 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
 
     # Ensure DB seeding happens inside app context at startup
-    with app.app_context():
-        try:
-            seed_default_users()
-        except Exception as e:
-            # Log error but don't prevent app from starting
-            print(f"Seed skipped due to error: {e}")
+    if not app.config["SKIP_SEED"]:
+        with app.app_context():
+            try:
+                seed_default_users()
+            except Exception as e:
+                # Log error but don't prevent app from starting
+                print(f"Seed skipped due to error: {e}")
 
     app.run(host=host, port=port, debug=debug_mode)
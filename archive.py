@@ -0,0 +1,209 @@
+"""Columnar archive of closed years.
+
+Each fully closed year of attendance, giving and expenses can be written to
+``<archive dir>/<dataset>/<year>.npz``: a compressed NumPy archive holding one
+array per column. Reading a column only decompresses that column, so analyses
+load just the columns and years they ask for, without touching the database.
+
+    flask --app app archive write 2019 [--purge] [--overwrite]
+    flask --app app archive trends --from 2015 --to 2025 [--tenant 2] [--archive-only]
+
+``read_years`` combines archived years with live rows for the years that are
+not archived yet. Months of an archived year can no longer be closed or
+reopened, so their period-close snapshots stay the database's per-service record.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# dataset -> (table, {column: kind}); kind decides the on-disk dtype
+DATASETS = {
+    "attendance": ("attendance_summary", {
+        "id": "int", "tenant_id": "int", "date": "text", "service_type": "text",
+        "male": "int", "female": "int", "children": "int", "total": "int",
+    }),
+    "giving": ("giving_summary", {
+        "id": "int", "tenant_id": "int", "date": "text", "service_type": "text",
+        "tithe": "real", "offering": "real", "special": "real", "entered_by": "text",
+    }),
+    "expenses": ("expenses", {
+        "id": "int", "tenant_id": "int", "date": "text", "service_type": "text", "category": "text",
+        "amount": "real", "payment_method": "text", "description": "text", "paid_by": "text",
+        "approved": "int", "approved_by": "text",
+    }),
+}
+
+
+def archive_dir(app):
+    return app.config.get("ARCHIVE_DIR") or os.environ.get("ARCHIVE_DIR") \
+        or os.path.join(app.instance_path, "archive")
+
+
+def _path(directory, dataset, year):
+    return os.path.join(directory, dataset, f"{year}.npz")
+
+
+def _year_bounds(year):
+    return f"{year}-01-01", f"{year}-12-31"
+
+
+def is_year_closed(db, year):
+    """True when all twelve months of ``year`` have been closed."""
+    closed = db.execute(
+        "SELECT COUNT(*) FROM period_closes WHERE month >= ? AND month <= ?", (f"{year}-01", f"{year}-12")
+    ).fetchone()[0]
+    return closed == 12
+
+
+def _to_array(series, kind):
+    if kind == "int":
+        return series.fillna(0).astype("int64").to_numpy()
+    if kind == "real":
+        return series.astype("float64").to_numpy()
+    # Fixed-width unicode keeps the file loadable with allow_pickle=False
+    return series.fillna("").astype(str).to_numpy(dtype=str)
+
+
+def _query_frame(db, table, columns, date_from, date_to):
+    cursor = db.execute(
+        f"SELECT {', '.join(columns)} FROM {table} WHERE date >= ? AND date <= ? ORDER BY date, id",
+        (date_from, date_to)
+    )
+    return pd.DataFrame([tuple(r) for r in cursor.fetchall()], columns=list(columns))
+
+
+def write_year(db, directory, year, overwrite=False):
+    """Archive every dataset for ``year``; returns {dataset: rows written}.
+
+    An existing archive of the year is only replaced with ``overwrite=True``, and
+    never by an empty query (the live rows are gone once a year is purged).
+    """
+    existing = [d for d in DATASETS if os.path.exists(_path(directory, d, year))]
+    if existing and not overwrite:
+        raise FileExistsError(f"{year} is already archived ({', '.join(existing)})")
+    frames = {d: _query_frame(db, table, kinds, *_year_bounds(year)) for d, (table, kinds) in DATASETS.items()}
+    emptied = [d for d in existing if frames[d].empty and archived_rows(directory, d, year)]
+    if emptied:
+        raise ValueError(f"The live tables hold no {', '.join(emptied)} rows for {year} but the archive does; "
+                         "refusing to replace it (was the year already purged?)")
+
+    written = {}
+    for dataset, (table, kinds) in DATASETS.items():
+        frame = frames[dataset]
+        path = _path(directory, dataset, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a half-written year
+        tmp = path[:-4] + ".tmp.npz"
+        np.savez_compressed(tmp, **{c: _to_array(frame[c], kind) for c, kind in kinds.items()})
+        os.replace(tmp, path)
+        written[dataset] = len(frame)
+    return written
+
+
+def archived_rows(directory, dataset, year):
+    """Row count of an archived year, read back from its file (0 if not archived)."""
+    path = _path(directory, dataset, year)
+    if not os.path.exists(path):
+        return 0
+    with np.load(path, allow_pickle=False) as npz:
+        return len(npz["id"])
+
+
+def verify_year(directory, year, written):
+    """Raise unless every archived file of ``year`` reads back with the row count that was written."""
+    for dataset, count in written.items():
+        found = archived_rows(directory, dataset, year)
+        if found != count:
+            raise ValueError(f"{dataset} archive for {year} reads back {found} row(s), expected {count}")
+
+
+def purge_year(db, year):
+    """Delete an archived year's rows from the live tables (caller commits).
+
+    Returns the rows removed as {tenant_id: {dataset: rows}}.
+    """
+    removed = {}
+    for dataset, (table, _) in DATASETS.items():
+        counts = db.execute(
+            f"SELECT tenant_id, COUNT(*) FROM {table} WHERE date >= ? AND date <= ? GROUP BY tenant_id",
+            _year_bounds(year)
+        ).fetchall()
+        for tenant_id, rows in counts:
+            removed.setdefault(tenant_id, {})[dataset] = rows
+        db.execute(f"DELETE FROM {table} WHERE date >= ? AND date <= ?", _year_bounds(year))
+    return removed
+
+
+def is_year_archived(directory, year):
+    """True when any dataset of ``year`` has an archive file."""
+    return any(os.path.exists(_path(directory, d, year)) for d in DATASETS)
+
+
+def archived_years(directory, dataset):
+    folder = os.path.join(directory, dataset)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(int(n[:-4]) for n in os.listdir(folder) if n.endswith(".npz") and n[:-4].isdigit())
+
+
+def read_archive(directory, dataset, years=None, columns=None, tenant_id=None):
+    """Archived rows of ``dataset`` as a DataFrame, loading only the given columns and years."""
+    columns = list(columns or DATASETS[dataset][1])
+    load = columns + (["tenant_id"] if tenant_id is not None and "tenant_id" not in columns else [])
+    frames = []
+    for year in archived_years(directory, dataset):
+        if years is not None and year not in years:
+            continue
+        with np.load(_path(directory, dataset, year), allow_pickle=False) as npz:
+            frame = pd.DataFrame({c: npz[c] for c in load})
+        if tenant_id is not None:
+            frame = frame[frame["tenant_id"] == tenant_id]
+        frames.append(frame[columns])
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_years(db, directory, dataset, years, columns=None, tenant_id=None):
+    """Rows for ``years`` from the archive where a year is archived, otherwise from the live table.
+
+    Pass ``db=None`` to read archived years only, without touching the database.
+    """
+    table, kinds = DATASETS[dataset]
+    columns = list(columns or kinds)
+    years = set(years)
+    archived = years & set(archived_years(directory, dataset))
+    frames = [read_archive(directory, dataset, archived, columns, tenant_id)]
+
+    live = sorted(years - archived)
+    if live and db is not None:
+        load = columns + [c for c in ("date", "tenant_id") if c not in columns]
+        frame = _query_frame(db, table, load, _year_bounds(live[0])[0], _year_bounds(live[-1])[1])
+        frame = frame[frame["date"].str[:4].astype(int).isin(live)]
+        if tenant_id is not None:
+            frame = frame[frame["tenant_id"] == tenant_id]
+        frames.append(frame[columns])
+    return pd.concat([f for f in frames if not f.empty] or frames[:1], ignore_index=True)
+
+
+def yearly_trends(db, directory, years, tenant_id=None):
+    """Attendance, giving and approved expenses per year (one row per year)."""
+    attendance = read_years(db, directory, "attendance", years, ["date", "total"], tenant_id)
+    giving = read_years(db, directory, "giving", years, ["date", "tithe", "offering", "special"], tenant_id)
+    expenses = read_years(db, directory, "expenses", years, ["date", "amount", "approved"], tenant_id)
+    expenses = expenses[expenses["approved"] == 1]
+
+    def by_year(frame, values):
+        if frame.empty:
+            return pd.Series(dtype="float64")
+        return values(frame).groupby(frame["date"].str[:4].astype(int)).sum()
+
+    trends = pd.DataFrame({
+        "attendance": by_year(attendance, lambda f: f["total"].astype("float64")),
+        "giving": by_year(giving, lambda f: f[["tithe", "offering", "special"]].astype("float64").fillna(0).sum(axis=1)),
+        "expenses": by_year(expenses, lambda f: f["amount"].astype("float64").fillna(0)),
+    }).reindex(sorted(years)).fillna(0)
+    trends["balance"] = trends["giving"] - trends["expenses"]
+    trends.index.name = "year"
+    return trends
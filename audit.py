@@ -0,0 +1,161 @@
+"""Write-behind audit trail.
+
+Routes call ``record(action, entity, entity_id, **details)`` after committing a
+change. The event is stamped with the time, user and branch and put on a bounded
+in-memory queue; a background thread writes queued events to ``audit_log`` in
+batches, so a request never waits on the audit insert. When the queue is full
+(AUDIT_QUEUE_MAX) new events are dropped and counted rather than blocking. Any
+events still queued are written when the process exits.
+
+CLI commands have no request or logged-in user; they call
+``record_cli(db, action, entity, entity_id, tenant_id, **details)`` instead,
+which writes the event on the command's own connection, in the same
+transaction as the change, with the actor ``cli:<os user>``.
+
+Settings: AUDIT_ENABLED (default on), AUDIT_QUEUE_MAX, AUDIT_BATCH_SIZE,
+AUDIT_FLUSH_INTERVAL (seconds).
+"""
+import atexit
+import getpass
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import current_app
+from flask_login import current_user
+
+from models import db_connection, insert_rows, current_tenant_id
+
+AUDIT_COLUMNS = ("created_at", "tenant_id", "actor", "action", "entity", "entity_id", "details")
+
+logger = logging.getLogger(__name__)
+_writer = None
+
+
+class AuditWriter:
+    """Bounded queue of audit rows drained in batches by one daemon thread."""
+
+    def __init__(self, max_queue, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def submit(self, row):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("dropped")
+            return
+        self._count("queued")
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_started(self):
+        # Started lazily so forking servers start it in each worker, not the parent
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far, batch_size rows per INSERT."""
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            try:
+                with db_connection() as db:
+                    insert_rows(db, "audit_log", AUDIT_COLUMNS, batch)
+                    db.commit()
+                self._count("written", len(batch))
+            except Exception:
+                self._count("failed", len(batch))
+                logger.exception("Could not write %d audit event(s)", len(batch))
+
+    def close(self, timeout=5):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+
+def init_audit(app):
+    global _writer
+    app.config.setdefault("AUDIT_ENABLED", os.environ.get("AUDIT_ENABLED", "1") == "1")
+    app.config.setdefault("AUDIT_QUEUE_MAX", int(os.environ.get("AUDIT_QUEUE_MAX", 10000)))
+    app.config.setdefault("AUDIT_BATCH_SIZE", int(os.environ.get("AUDIT_BATCH_SIZE", 200)))
+    app.config.setdefault("AUDIT_FLUSH_INTERVAL", float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0)))
+    if app.config["AUDIT_ENABLED"]:
+        _writer = AuditWriter(
+            app.config["AUDIT_QUEUE_MAX"], app.config["AUDIT_BATCH_SIZE"], app.config["AUDIT_FLUSH_INTERVAL"]
+        )
+
+
+def _row(tenant_id, actor, action, entity, entity_id, details):
+    return (
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        tenant_id,
+        actor,
+        action,
+        entity,
+        None if entity_id is None else str(entity_id),
+        json.dumps(details, default=str, sort_keys=True) if details else None,
+    )
+
+
+def _cli_actor():
+    try:
+        return "cli:" + getpass.getuser()
+    except Exception:
+        return "cli:unknown"
+
+
+def record(action, entity, entity_id=None, **details):
+    """Queue an audit event for the current user and branch; never blocks the request."""
+    if _writer is None:
+        return
+    _writer.submit(_row(
+        current_tenant_id(), current_user.email if current_user.is_authenticated else None,
+        action, entity, entity_id, details,
+    ))
+
+
+def record_cli(db, action, entity, entity_id=None, tenant_id=None, **details):
+    """Write an audit event for a CLI command on ``db`` right away (the caller commits).
+
+    Commands are short-lived and run without a request, so nothing is queued.
+    """
+    if not current_app.config.get("AUDIT_ENABLED", True):
+        return
+    insert_rows(db, "audit_log", AUDIT_COLUMNS, [_row(tenant_id, _cli_actor(), action, entity, entity_id, details)])
+
+
+def audit_stats():
+    return dict(_writer.stats, pending=_writer._queue.qsize()) if _writer is not None else None
@@ -0,0 +1,374 @@
+"""Management commands (``flask --app app <command>``).
+
+    flask --app app users list [--role pastor] [--inactive]
+    flask --app app users import volunteers.csv [--workers 4] [--default-role usher] [--tenant 2]
+    flask --app app users set-role admin someone@church.com [more@church.com ...]
+    flask --app app users deactivate someone@church.com [...]   (activate is the inverse)
+    flask --app app members import members.csv [--tenant 2]
+    flask --app app export giving -o giving.csv --date-from 2024-01-01 --date-to 2024-12-31 [--tenant 2]
+    flask --app app archive write 2019 [--purge] [--overwrite]   (see archive.py)
+
+All commands go through the app's data layer (models.db_connection), so they
+work against whatever DATABASE_URL the app uses.
+"""
+import csv
+import os
+import secrets
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.security import generate_password_hash
+
+import archive
+from audit import record_cli
+from models import db_connection, insert_rows, DEFAULT_TENANT_ID
+
+ROLES = ("admin", "pastor", "finance", "usher")
+BATCH_SIZE = 500
+
+users_cli = AppGroup("users", help="Manage user accounts.")
+members_cli = AppGroup("members", help="Manage members.")
+archive_cli = AppGroup("archive", help="Columnar archive of closed years.")
+
+
+def register_commands(app):
+    app.cli.add_command(users_cli)
+    app.cli.add_command(members_cli)
+    app.cli.add_command(export_command)
+    app.cli.add_command(archive_cli)
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _existing_values(db, table, column, values, tenant_id=None):
+    """Which of ``values`` (lowercase) already exist in ``table.column``, compared case-insensitively."""
+    found = set()
+    scope, scope_params = ("tenant_id = ? AND ", [tenant_id]) if tenant_id is not None else ("", [])
+    for chunk in _chunks(sorted(values)):
+        rows = db.execute(
+            f"SELECT LOWER({column}) FROM {table} WHERE {scope}LOWER({column}) IN ({', '.join('?' for _ in chunk)})",
+            scope_params + chunk
+        ).fetchall()
+        found.update(r[0] for r in rows)
+    return found
+
+
+def hash_passwords(passwords, workers):
+    """Hash passwords across a process pool; each hash is deliberately CPU-bound."""
+    if workers <= 1 or len(passwords) < 8:
+        return [generate_password_hash(p) for p in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+def _tenant_option(fn):
+    return click.option("--tenant", "tenant_id", type=int, default=DEFAULT_TENANT_ID, show_default=True,
+                        help="Branch (tenant) id the rows belong to.")(fn)
+
+
+def _check_tenant(db, tenant_id):
+    if db.execute("SELECT 1 FROM tenants WHERE id=?", (tenant_id,)).fetchone() is None:
+        raise click.ClickException(f"No branch with id {tenant_id}.")
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [{(k or "").strip().lower(): (v or "").strip() for k, v in row.items()} for row in csv.DictReader(f)]
+
+
+# ---------------------------
+# Users
+# ---------------------------
+@users_cli.command("list")
+@click.option("--role", type=click.Choice(ROLES), help="Only users with this role.")
+@click.option("--inactive", is_flag=True, help="Only deactivated users.")
+def users_list(role, inactive):
+    """List users."""
+    clauses, params = [], []
+    if role:
+        clauses.append("role=?")
+        params.append(role)
+    if inactive:
+        clauses.append("active=0")
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    with db_connection() as db:
+        rows = db.execute(
+            f"SELECT id, name, email, role, active, tenant_id FROM users{where} ORDER BY tenant_id, name", params
+        ).fetchall()
+    if not rows:
+        click.echo("No users found.")
+    for row in rows:
+        click.echo(f"ID: {row['id']}, Name: {row['name']}, Email: {row['email']}, Role: {row['role']}, "
+                   f"Active: {row['active']}, Branch: {row['tenant_id']}")
+
+
+@users_cli.command("import")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--default-role", type=click.Choice(ROLES), default="usher", show_default=True,
+              help="Role for rows without a role column/value.")
+@click.option("--workers", type=int, default=os.cpu_count() or 1, show_default=True,
+              help="Processes used for password hashing.")
+@click.option("--credentials-out", type=click.Path(dir_okay=False),
+              help="Where to write generated passwords (default: <csv>_credentials.csv).")
+@_tenant_option
+def users_import(csv_path, default_role, workers, credentials_out, tenant_id):
+    """Bulk-create users from a CSV with name,email[,role][,password] columns.
+
+    Existing emails are skipped. Rows without a password get a random one,
+    written to an owner-only credentials file so they can be handed out.
+    """
+    rows, seen, errors = [], set(), []
+    for line, row in enumerate(_read_csv(csv_path), start=2):
+        email = row.get("email", "").lower()
+        role = (row.get("role") or default_role).lower()
+        if not row.get("name") or "@" not in email:
+            errors.append(f"line {line}: name and a valid email are required")
+        elif role not in ROLES:
+            errors.append(f"line {line}: unknown role {role!r}")
+        elif email not in seen:
+            seen.add(email)
+            rows.append({"name": row["name"], "email": email, "role": role, "password": row.get("password")})
+    if errors:
+        raise click.ClickException("Nothing imported:\n  " + "\n  ".join(errors))
+
+    with db_connection() as db:
+        _check_tenant(db, tenant_id)
+        existing = _existing_values(db, "users", "email", [r["email"] for r in rows])
+        new_rows = [r for r in rows if r["email"] not in existing]
+        generated = []
+        for r in new_rows:
+            if not r["password"]:
+                r["password"] = secrets.token_urlsafe(9)
+                generated.append(r)
+
+        # Hash only the rows that will actually be inserted
+        hashes = hash_passwords([r["password"] for r in new_rows], workers)
+        for chunk in _chunks(list(zip(new_rows, hashes))):
+            insert_rows(db, "users", ("name", "email", "password", "role", "active", "tenant_id"),
+                        [(r["name"], r["email"], pw_hash, r["role"], 1, tenant_id) for r, pw_hash in chunk])
+        if new_rows:
+            record_cli(db, "import", "users", tenant_id=tenant_id, source=os.path.basename(csv_path),
+                       count=len(new_rows), emails=[r["email"] for r in new_rows])
+        db.commit()
+
+    if generated:
+        credentials_out = credentials_out or os.path.splitext(csv_path)[0] + "_credentials.csv"
+        # Owner-only from the start; chmod covers a file left over from an earlier run
+        fd = os.open(credentials_out, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(credentials_out, 0o600)
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["email", "password"])
+            writer.writerows((r["email"], r["password"]) for r in generated)
+        click.echo(f"Generated passwords written to {credentials_out} (owner-only). "
+                   "It contains plaintext passwords: hand them out, then delete the file.")
+    click.echo(f"Imported {len(new_rows)} user(s); skipped {len(existing)} existing.")
+
+
+def _update_users(action, sql, params, emails, **details):
+    emails = sorted({e.strip().lower() for e in emails})
+    updated = 0
+    with db_connection() as db:
+        for chunk in _chunks(emails):
+            in_emails = f"LOWER(email) IN ({', '.join('?' for _ in chunk)})"
+            users = db.execute(f"SELECT id, email, tenant_id FROM users WHERE {in_emails}", chunk).fetchall()
+            cursor = db.execute(f"{sql} WHERE {in_emails}", list(params) + chunk)
+            updated += cursor.rowcount
+            for user in users:
+                record_cli(db, action, "users", user["id"], user["tenant_id"], email=user["email"], **details)
+        db.commit()
+    missing = len(emails) - updated
+    click.echo(f"Updated {updated} user(s)." + (f" {missing} email(s) not found." if missing > 0 else ""))
+
+
+def _emails_option(fn):
+    fn = click.argument("emails", nargs=-1)(fn)
+    return click.option("--from-file", type=click.File(), help="Read emails from a file, one per line.")(fn)
+
+
+def _collect_emails(emails, from_file):
+    emails = list(emails) + ([line for line in from_file.read().split() if line] if from_file else [])
+    if not emails:
+        raise click.UsageError("Give at least one email (or --from-file).")
+    return emails
+
+
+@users_cli.command("set-role")
+@click.argument("role", type=click.Choice(ROLES))
+@_emails_option
+def users_set_role(role, emails, from_file):
+    """Give ROLE to every listed user (and make sure they are active)."""
+    _update_users("set_role", "UPDATE users SET role=?, active=1", [role], _collect_emails(emails, from_file), role=role)
+
+
+@users_cli.command("deactivate")
+@_emails_option
+def users_deactivate(emails, from_file):
+    """Deactivate the listed users; they can no longer log in."""
+    _update_users("deactivate", "UPDATE users SET active=0", [], _collect_emails(emails, from_file))
+
+
+@users_cli.command("activate")
+@_emails_option
+def users_activate(emails, from_file):
+    """Reactivate the listed users."""
+    _update_users("activate", "UPDATE users SET active=1", [], _collect_emails(emails, from_file))
+
+
+# ---------------------------
+# Members
+# ---------------------------
+@members_cli.command("import")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+@_tenant_option
+def members_import(csv_path, tenant_id):
+    """Bulk-add members from a CSV with name[,email][,phone][,joined_date] columns.
+
+    Rows whose email already belongs to a member of the branch are skipped.
+    """
+    rows = [r for r in _read_csv(csv_path) if r.get("name")]
+    with db_connection() as db:
+        _check_tenant(db, tenant_id)
+        emails = {r["email"].lower() for r in rows if r.get("email")}
+        existing = _existing_values(db, "members", "email", emails, tenant_id)
+        seen, new_rows = set(), []
+        for r in rows:
+            email = r.get("email", "").lower()
+            if email and (email in existing or email in seen):
+                continue
+            seen.add(email)
+            new_rows.append((r["name"], r.get("email", ""), r.get("phone", ""), r.get("joined_date", ""), 1, tenant_id))
+        for chunk in _chunks(new_rows):
+            insert_rows(db, "members", ("name", "email", "phone", "joined_date", "active", "tenant_id"), chunk)
+        if new_rows:
+            record_cli(db, "import", "members", tenant_id=tenant_id, source=os.path.basename(csv_path),
+                       count=len(new_rows))
+        db.commit()
+    click.echo(f"Imported {len(new_rows)} member(s); skipped {len(rows) - len(new_rows)}.")
+
+
+# ---------------------------
+# Export
+# ---------------------------
+EXPORTS = {
+    "users": ("SELECT id, tenant_id, name, email, role, active FROM users", None),
+    "members": ("SELECT id, tenant_id, name, email, phone, joined_date, active FROM members", "joined_date"),
+    "attendance": ("SELECT id, tenant_id, date, service_type, male, female, children, total FROM attendance_summary", "date"),
+    "giving": ("SELECT id, tenant_id, date, service_type, tithe, offering, special, entered_by FROM giving_summary", "date"),
+    "expenses": ("SELECT id, tenant_id, date, service_type, category, amount, payment_method, description, paid_by, "
+                 "approved, approved_by FROM expenses", "date"),
+}
+
+
+@click.command("export")
+@click.argument("table", type=click.Choice(sorted(EXPORTS)))
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="CSV file to write (default: stdout).")
+@click.option("--date-from", help="YYYY-MM-DD, inclusive.")
+@click.option("--date-to", help="YYYY-MM-DD, inclusive.")
+@click.option("--tenant", "tenant_id", type=int, help="Only this branch (default: all branches).")
+def export_command(table, output, date_from, date_to, tenant_id):
+    """Export TABLE to CSV (password hashes are never exported)."""
+    sql, date_col = EXPORTS[table]
+    clauses, params = [], []
+    if tenant_id is not None:
+        clauses.append("tenant_id = ?")
+        params.append(tenant_id)
+    if date_col and date_from:
+        clauses.append(f"{date_col} >= ?")
+        params.append(date_from)
+    if date_col and date_to:
+        clauses.append(f"{date_col} <= ?")
+        params.append(date_to)
+    sql += (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY tenant_id, id"
+
+    out = open(output, "w", newline="") if output else sys.stdout
+    count = 0
+    try:
+        writer = csv.writer(out)
+        with db_connection() as db:
+            cursor = db.execute(sql, params)
+            writer.writerow([col[0] for col in cursor.description])
+            while True:
+                batch = cursor.fetchmany(BATCH_SIZE)
+                if not batch:
+                    break
+                writer.writerows(tuple(r) for r in batch)
+                count += len(batch)
+    finally:
+        if output:
+            out.close()
+    if output:
+        click.echo(f"Exported {count} {table} row(s) to {output}")
+
+
+# ---------------------------
+# Archive
+# ---------------------------
+@archive_cli.command("write")
+@click.argument("year", type=int)
+@click.option("--purge", is_flag=True, help="Delete the year's rows from the live tables once archived.")
+@click.option("--overwrite", is_flag=True, help="Replace the year's existing archive files.")
+def archive_write(year, purge, overwrite):
+    """Write closed YEAR's attendance, giving and expenses to the archive.
+
+    All twelve months must be closed. --purge only runs once the written files
+    read back with the expected row counts. The months' period-close snapshots
+    are kept, and an archived year's months can no longer be reopened, so after
+    a purge those snapshots hold the year's per-service totals.
+    """
+    directory = archive.archive_dir(current_app)
+    with db_connection() as db:
+        if not archive.is_year_closed(db, year):
+            raise click.ClickException(f"{year} is not fully closed; close all twelve months first.")
+        try:
+            written = archive.write_year(db, directory, year, overwrite)
+            archive.verify_year(directory, year, written)
+        except FileExistsError as e:
+            raise click.ClickException(f"{e}; pass --overwrite to replace it.")
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if purge:
+            for tenant_id, counts in archive.purge_year(db, year).items():
+                record_cli(db, "purge", "archive", year, tenant_id, **counts)
+            db.commit()
+    for dataset, count in written.items():
+        click.echo(f"{dataset}: {count} row(s) archived")
+    click.echo(f"Archive written to {directory}" + (f"; {year} removed from the live tables." if purge else "."))
+
+
+@archive_cli.command("list")
+def archive_list():
+    """Show archived years per dataset."""
+    directory = archive.archive_dir(current_app)
+    for dataset in archive.DATASETS:
+        years = archive.archived_years(directory, dataset)
+        click.echo(f"{dataset}: {', '.join(map(str, years)) if years else 'none'}")
+
+
+@archive_cli.command("trends")
+@click.option("--from", "year_from", type=int, required=True)
+@click.option("--to", "year_to", type=int, required=True)
+@click.option("--tenant", "tenant_id", type=int, help="Only this branch (default: all branches).")
+@click.option("--archive-only", is_flag=True, help="Read archived years only; never touch the database.")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="Write the table as CSV instead.")
+def archive_trends(year_from, year_to, tenant_id, archive_only, output):
+    """Attendance, giving, approved expenses and balance per year."""
+    years = range(year_from, year_to + 1)
+    directory = archive.archive_dir(current_app)
+    if archive_only:
+        trends = archive.yearly_trends(None, directory, years, tenant_id)
+    else:
+        with db_connection() as db:
+            trends = archive.yearly_trends(db, directory, years, tenant_id)
+    if output:
+        trends.to_csv(output)
+        click.echo(f"Wrote {len(trends)} year(s) to {output}")
+    else:
+        click.echo(trends.round(2).to_string())
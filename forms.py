@@ -4,11 +4,18 @@ from flask_wtf import FlaskForm
 class ApproveExpenseForm(FlaskForm):
     pass
 
+import uuid
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, BooleanField
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, HiddenField
 from wtforms.validators import DataRequired, Email
 from datetime import date
 
+
+def new_idempotency_key():
+    # Fresh per rendered form; a double-submitted form posts the same key twice
+    return uuid.uuid4().hex
+
+
 # Form for admin clear data action
 class ClearDataForm(FlaskForm):
     delete_attendance = BooleanField('Attendance')
@@ -26,6 +33,7 @@ class LoginForm(FlaskForm):
 
 
 class AttendanceForm(FlaskForm):
+    idempotency_key = HiddenField(default=new_idempotency_key)
     date = StringField('Date', validators=[DataRequired()])
     service_type = StringField('Service Type', validators=[DataRequired()])
     male = StringField('Male', validators=[])  # will parse to int in route
@@ -36,6 +44,7 @@ class AttendanceForm(FlaskForm):
 
 
 class GivingForm(FlaskForm):
+    idempotency_key = HiddenField(default=new_idempotency_key)
     date = StringField('Date', default=date.today().strftime('%Y-%m-%d'), validators=[DataRequired()])
     service_type = StringField('Service Type', validators=[DataRequired()])
     tithe = StringField('Tithe', validators=[])
@@ -47,6 +56,7 @@ class GivingForm(FlaskForm):
 from wtforms import FloatField, SelectField, TextAreaField
 
 class ExpenseForm(FlaskForm):
+    idempotency_key = HiddenField(default=new_idempotency_key)
     date = StringField('Date', default=date.today().strftime('%Y-%m-%d'), validators=[DataRequired()])
     service_type = StringField('Service Type', validators=[DataRequired()])
     category = StringField('Category', validators=[DataRequired()])
@@ -54,3 +64,38 @@ class ExpenseForm(FlaskForm):
     payment_method = SelectField('Payment Method', choices=[('cash','Cash'),('transfer','Transfer'),('cheque','Cheque')], validators=[DataRequired()])
     description = TextAreaField('Description')
     submit = SubmitField('Add Expense')
+
+
+# Batch (grid) entry: one sub-form per service row; CSRF lives on the outer form only
+from wtforms import Form, FieldList, FormField
+
+BATCH_MIN_ROWS = 10
+BATCH_MAX_ROWS = 50
+
+
+class AttendanceRowForm(Form):
+    date = StringField('Date')
+    service_type = StringField('Service Type')
+    male = StringField('Male')
+    female = StringField('Female')
+    children = StringField('Children')
+
+
+class BatchAttendanceForm(FlaskForm):
+    idempotency_key = HiddenField(default=new_idempotency_key)
+    rows = FieldList(FormField(AttendanceRowForm), min_entries=BATCH_MIN_ROWS, max_entries=BATCH_MAX_ROWS)
+    submit = SubmitField('Save All')
+
+
+class GivingRowForm(Form):
+    date = StringField('Date')
+    service_type = StringField('Service Type')
+    tithe = StringField('Tithe')
+    offering = StringField('Offering')
+    special = StringField('Special')
+
+
+class BatchGivingForm(FlaskForm):
+    idempotency_key = HiddenField(default=new_idempotency_key)
+    rows = FieldList(FormField(GivingRowForm), min_entries=BATCH_MIN_ROWS, max_entries=BATCH_MAX_ROWS)
+    submit = SubmitField('Save All')
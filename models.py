@@ -1,104 +1,695 @@
 import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from werkzeug.security import generate_password_hash
-from flask import g
-from flask_login import UserMixin
+from flask import current_app, g, request, session
+from flask_login import UserMixin, current_user
 
 DB_URL = os.environ.get("DATABASE_URL")
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+# Seconds a request waits for a free pooled connection before failing with PoolExhausted (503)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+
+# Optional read replica for read-only pages (same backend as DATABASE_URL)
+DB_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+REPLICA_RETRY_SECONDS = 30
+REPLICA_LAG_CHECK_SECONDS = 2
+
+# Branches (tenants). Rows created before multi-branch support belong to branch 1.
+DEFAULT_TENANT_ID = 1
+TENANT_CACHE_SECONDS = float(os.environ.get("TENANT_CACHE_SECONDS", 30))
+TENANT_TABLES = ("users", "members", "attendance_summary", "giving_summary", "expenses", "service_snapshots")
+
+# DATABASE_URL=sqlite:///path/to/file.db runs against a local SQLite file instead
+# of Postgres (development, load testing).
+SQLITE_PREFIX = "sqlite:///"
+
+IntegrityError = (psycopg2.IntegrityError, sqlite3.IntegrityError)
+
+
+def is_sqlite(url=None):
+    return (url or DB_URL or "").startswith(SQLITE_PREFIX)
 
 
 # ----------------------
 # Database connection
 # ----------------------
+class PgConnection:
+    """psycopg2 connection exposing the sqlite3-style API the routes use.
+
+    ``db.execute(sql, params)`` with ``?`` placeholders returns a cursor whose rows
+    support both ``row[0]`` and ``row['name']`` access, like ``sqlite3.Row``.
+    """
+
+    def __init__(self, raw, pool):
+        self.raw = raw
+        self.pool = pool
+
+    @staticmethod
+    def _sql(sql):
+        return sql.replace("%", "%%").replace("?", "%s")
+
+    def execute(self, sql, params=()):
+        cursor = self.raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(self._sql(sql), tuple(params))
+        return cursor
+
+    def executemany(self, sql, seq_of_params):
+        cursor = self.raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.executemany(self._sql(sql), [tuple(p) for p in seq_of_params])
+        return cursor
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+
+class PoolExhausted(psycopg2.pool.PoolError):
+    """No pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free connection instead of failing.
+
+    psycopg2 raises PoolError as soon as ``maxconn`` connections are checked out.
+    Here each checkout takes a slot from a semaphore, so with more threads than
+    DB_POOL_MAX (the audit writer holds one too while flushing) extra requests
+    queue for up to DB_POOL_TIMEOUT seconds and only then fail.
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            with _stats_lock:
+                _stats["pool_exhausted"] += 1
+            raise PoolExhausted(f"no database connection free after {DB_POOL_TIMEOUT:g}s (DB_POOL_MAX={self.maxconn})")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"checkouts": 0, "in_use": 0, "peak_in_use": 0, "pool_exhausted": 0,
+          "replica_reads": 0, "replica_fallbacks": 0}
+
+
+def _get_pool(url):
+    """One connection pool per DSN (primary, and the replica when configured)."""
+    pool = _pools.get(url)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(url)
+            if pool is None:
+                pool = _pools[url] = BlockingConnectionPool(DB_POOL_MIN, DB_POOL_MAX, url)
+    return pool
+
+
+def acquire_connection(url=None, read_only=False):
+    """Check a connection out of the pool (or open a SQLite connection).
+
+    ``read_only`` opens a SQLite file in read-only mode, so a missing file raises
+    instead of being created empty (used for the SQLite replica stand-in).
+    """
+    url = url or DB_URL
+    if is_sqlite(url):
+        path = url[len(SQLITE_PREFIX):]
+        if read_only:
+            db = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True, timeout=30,
+                                 check_same_thread=False)
+        else:
+            db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+        db.row_factory = sqlite3.Row
+    else:
+        pool = _get_pool(url)
+        db = PgConnection(pool.getconn(), pool)
+    with _stats_lock:
+        _stats["checkouts"] += 1
+        _stats["in_use"] += 1
+        _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+    return db
+
+
+def release_connection(db):
+    try:
+        if isinstance(db, PgConnection):
+            # Never hand a connection with an open transaction back to the pool
+            try:
+                db.raw.rollback()
+            except psycopg2.Error:
+                db.pool.putconn(db.raw, close=True)
+            else:
+                db.pool.putconn(db.raw)
+        else:
+            db.close()
+    finally:
+        with _stats_lock:
+            _stats["in_use"] -= 1
+
+
+def connection_stats():
+    """Snapshot of connection usage since start-up (used by the load-test harness)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    pool = _pools.get(DB_URL)
+    if pool is not None:
+        stats["pool_open"] = len(pool._pool) + len(pool._used)
+        stats["pool_max"] = pool.maxconn
+    replica_pool = _pools.get(DB_REPLICA_URL)
+    if replica_pool is not None:
+        stats["replica_pool_open"] = len(replica_pool._pool) + len(replica_pool._used)
+    return stats
+
+
+def insert_rows(db, table, columns, rows):
+    """Insert ``rows`` with a single multi-row ``INSERT ... VALUES (...), (...)`` statement."""
+    if not rows:
+        return
+    placeholders = "(" + ", ".join("?" for _ in columns) + ")"
+    db.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join(placeholders for _ in rows),
+        [value for row in rows for value in row]
+    )
+
+
+@contextmanager
+def db_connection():
+    db = acquire_connection()
+    try:
+        yield db
+    finally:
+        release_connection(db)
+
+
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = psycopg2.connect(DB_URL, cursor_factory=psycopg2.extras.RealDictCursor)
+        db = g._database = acquire_connection()
     return db
 
 def close_db(e=None):
-    db = getattr(g, "_database", None)
-    if db is not None:
-        db.close()
-        g._database = None
+    for attr in ("_database", "_read_database"):
+        db = getattr(g, attr, None)
+        if db is not None:
+            release_connection(db)
+            setattr(g, attr, None)
+
+
+# ----------------------
+# Read replica
+# ----------------------
+# Read-only pages call get_read_db(). With DATABASE_REPLICA_URL set it returns a
+# replica connection, unless the replica is unreachable (retried after
+# REPLICA_RETRY_SECONDS), lags more than REPLICA_MAX_LAG_SECONDS, or this session
+# wrote something in the last READ_YOUR_WRITES_SECONDS; then it is the primary.
+_replica_state = {"down_until": 0.0, "lag": 0.0, "lag_checked": 0.0}
+_replica_lock = threading.Lock()
+
+# Replay lag in seconds; 0 when fully caught up (or when pointed at a primary)
+REPLICA_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+def _replica_lag(db):
+    if isinstance(db, PgConnection):
+        return float(db.execute(REPLICA_LAG_SQL).fetchone()[0] or 0)
+    # A SQLite file standing in for a replica has no replication to measure; just make
+    # sure it holds the schema (an empty or foreign file fails here, not mid-page)
+    db.execute("SELECT 1 FROM tenants LIMIT 1").fetchone()
+    return 0.0
+
+
+def _acquire_replica():
+    now = time.time()
+    if now < _replica_state["down_until"]:
+        return None
+    db = None
+    try:
+        db = acquire_connection(DB_REPLICA_URL, read_only=True)
+        if now - _replica_state["lag_checked"] >= REPLICA_LAG_CHECK_SECONDS:
+            lag = _replica_lag(db)
+            with _replica_lock:
+                _replica_state.update(lag=lag, lag_checked=now)
+            if lag > REPLICA_MAX_LAG_SECONDS:
+                current_app.logger.warning("Read replica lags %.1fs; reading from primary", lag)
+    except (psycopg2.Error, sqlite3.Error) as e:
+        if db is not None:
+            release_connection(db)
+        with _replica_lock:
+            _replica_state["down_until"] = now + REPLICA_RETRY_SECONDS
+        current_app.logger.warning("Read replica unavailable, using primary for %ds: %s", REPLICA_RETRY_SECONDS, e)
+        return None
+    if _replica_state["lag"] > REPLICA_MAX_LAG_SECONDS:
+        release_connection(db)
+        return None
+    return db
+
+
+def _wrote_recently():
+    return time.time() - session.get("last_write_at", 0) < READ_YOUR_WRITES_SECONDS
+
+
+def get_read_db():
+    """Connection for read-only pages: the replica when it is safe to read from, else the primary."""
+    if not DB_REPLICA_URL or _wrote_recently():
+        return get_db()
+    db = getattr(g, "_read_database", None)
+    if db is None:
+        db = _acquire_replica()
+        # Counted per request: pages served by the replica vs. sent to the primary
+        # because it was unreachable or lagging
+        with _stats_lock:
+            _stats["replica_reads" if db is not None else "replica_fallbacks"] += 1
+        if db is None:
+            return get_db()
+        g._read_database = db
+    return db
+
+
+def remember_write(response):
+    """after_request hook: after a write, drop the branch's cached values and note the
+    time for read-your-writes.
+
+    Only signed-in writes count: anonymous or throttled login POSTs change no branch
+    data, and a login itself should not pin the new session to the primary.
+    """
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        return response
+    if not current_user.is_authenticated or request.endpoint == "auth.login":
+        return response
+    tenant_cache.invalidate(current_tenant_id())
+    if DB_REPLICA_URL:
+        session["last_write_at"] = time.time()
+    return response
 
 
 # ----------------------
 # Initialize tables
 # ----------------------
+def _ddl(sql):
+    if is_sqlite():
+        return sql.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+    return sql
+
+
+def _add_tenant_column(db, table):
+    if is_sqlite():
+        columns = [r["name"] for r in db.execute(f"PRAGMA table_info({table})").fetchall()]
+        if "tenant_id" in columns:
+            return
+        db.execute(f"ALTER TABLE {table} ADD COLUMN tenant_id INTEGER NOT NULL DEFAULT {DEFAULT_TENANT_ID};")
+    else:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL DEFAULT {DEFAULT_TENANT_ID};")
+
+
 def init_db():
-    with psycopg2.connect(DB_URL) as db:
-        with db.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT,
-                    email TEXT UNIQUE,
-                    password TEXT,
-                    role TEXT,
-                    active INTEGER DEFAULT 1
-                );
+    with db_connection() as db:
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS tenants (
+                id SERIAL PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL
+            );
+        """))
+        if db.execute("SELECT COUNT(*) FROM tenants").fetchone()[0] == 0:
+            db.execute("INSERT INTO tenants (id, name) VALUES (?, ?)", (DEFAULT_TENANT_ID, "Main Branch"))
+            if not is_sqlite():
+                db.execute("SELECT setval(pg_get_serial_sequence('tenants', 'id'), (SELECT MAX(id) FROM tenants))")
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                name TEXT,
+                email TEXT UNIQUE,
+                password TEXT,
+                role TEXT,
+                active INTEGER DEFAULT 1
+            );
+        """))
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS attendance_summary (
+                id SERIAL PRIMARY KEY,
+                date TEXT,
+                service_type TEXT,
+                male INTEGER,
+                female INTEGER,
+                children INTEGER,
+                total INTEGER
+            );
+        """))
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS giving_summary (
+                id SERIAL PRIMARY KEY,
+                date TEXT,
+                service_type TEXT,
+                tithe REAL,
+                offering REAL,
+                special REAL,
+                entered_by TEXT
+            );
+        """))
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS expenses (
+                id SERIAL PRIMARY KEY,
+                date TEXT,
+                service_type TEXT,
+                category TEXT,
+                amount REAL,
+                payment_method TEXT,
+                description TEXT,
+                paid_by TEXT,
+                approved INTEGER DEFAULT 0,
+                approved_by TEXT
+            );
+        """))
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS members (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                email TEXT,
+                phone TEXT,
+                joined_date TEXT,
+                active INTEGER DEFAULT 1
+            );
+        """))
+        # Period close: a closed month's per-service totals are frozen in service_snapshots
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS period_closes (
+                month TEXT PRIMARY KEY,
+                closed_at TEXT,
+                closed_by TEXT
+            );
+        """))
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS service_snapshots (
+                id SERIAL PRIMARY KEY,
+                month TEXT NOT NULL,
+                date TEXT,
+                service_type TEXT,
+                male INTEGER,
+                female INTEGER,
+                children INTEGER,
+                attendance INTEGER,
+                tithe REAL,
+                offering REAL,
+                special REAL,
+                giving_entries INTEGER,
+                total_giving REAL,
+                total_expenses REAL,
+                balance REAL
+            );
+        """))
+        db.execute("CREATE INDEX IF NOT EXISTS idx_service_snapshots_month ON service_snapshots (month);")
+        # Idempotency keys for entry forms; rows expire after IDEMPOTENCY_TTL_SECONDS
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                result TEXT,
+                created_at INTEGER
+            );
+        """))
+        db.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);")
+        # Audit trail (written in batches by audit.AuditWriter)
+        db.execute(_ddl("""
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id SERIAL PRIMARY KEY,
+                created_at TEXT,
+                tenant_id INTEGER,
+                actor TEXT,
+                action TEXT,
+                entity TEXT,
+                entity_id TEXT,
+                details TEXT
+            );
+        """))
+        # The viewer pages newest-first within a branch, optionally by entity or user
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_tenant_id ON audit_log (tenant_id, id);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_tenant_entity_id ON audit_log (tenant_id, entity, id);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_tenant_actor_id ON audit_log (tenant_id, actor, id);")
+        # Full-text search over expenses (description, category, paid_by)
+        if is_sqlite():
+            fts_missing = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='expenses_fts'"
+            ).fetchone() is None
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5("
+                "description, category, paid_by, content='expenses', content_rowid='id', "
+                "tokenize='porter unicode61');"
+            )
+            # External-content FTS5 table kept in sync by triggers
+            db.execute("""
+                CREATE TRIGGER IF NOT EXISTS expenses_fts_ai AFTER INSERT ON expenses BEGIN
+                    INSERT INTO expenses_fts (rowid, description, category, paid_by)
+                    VALUES (new.id, new.description, new.category, new.paid_by);
+                END;
             """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS attendance_summary (
-                    id SERIAL PRIMARY KEY,
-                    date TEXT,
-                    service_type TEXT,
-                    male INTEGER,
-                    female INTEGER,
-                    children INTEGER,
-                    total INTEGER
-                );
+            db.execute("""
+                CREATE TRIGGER IF NOT EXISTS expenses_fts_ad AFTER DELETE ON expenses BEGIN
+                    INSERT INTO expenses_fts (expenses_fts, rowid, description, category, paid_by)
+                    VALUES ('delete', old.id, old.description, old.category, old.paid_by);
+                END;
             """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS giving_summary (
-                    id SERIAL PRIMARY KEY,
-                    date TEXT,
-                    service_type TEXT,
-                    tithe REAL,
-                    offering REAL,
-                    special REAL,
-                    entered_by TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS expenses (
-                    id SERIAL PRIMARY KEY,
-                    date TEXT,
-                    service_type TEXT,
-                    category TEXT,
-                    amount REAL,
-                    payment_method TEXT,
-                    description TEXT,
-                    paid_by TEXT,
-                    approved INTEGER DEFAULT 0,
-                    approved_by TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS members (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    email TEXT,
-                    phone TEXT,
-                    joined_date TEXT,
-                    active INTEGER DEFAULT 1
-                );
+            db.execute("""
+                CREATE TRIGGER IF NOT EXISTS expenses_fts_au AFTER UPDATE OF description, category, paid_by ON expenses BEGIN
+                    INSERT INTO expenses_fts (expenses_fts, rowid, description, category, paid_by)
+                    VALUES ('delete', old.id, old.description, old.category, old.paid_by);
+                    INSERT INTO expenses_fts (rowid, description, category, paid_by)
+                    VALUES (new.id, new.description, new.category, new.paid_by);
+                END;
             """)
+            if fts_missing:
+                db.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild');")
+        else:
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_expenses_search ON expenses USING GIN ({EXPENSE_SEARCH_DOCUMENT});")
+        # Every branch-scoped table carries tenant_id; all indexes below lead with it
+        for table in TENANT_TABLES:
+            _add_tenant_column(db, table)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_users_tenant_name ON users (tenant_id, name);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_members_tenant_name ON members (tenant_id, name);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_expenses_tenant_amount ON expenses (tenant_id, amount);")
+        # Keyset pagination on reports seeks on (date, id) within a branch
+        db.execute("CREATE INDEX IF NOT EXISTS idx_attendance_tenant_date_id ON attendance_summary (tenant_id, date, id);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_expenses_tenant_approved_date_id ON expenses (tenant_id, approved, date, id);")
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_service_snapshots_tenant_date_service "
+            "ON service_snapshots (tenant_id, date, service_type);"
+        )
+        # Per-service views group and join on (date, normalised service_type)
+        for table in ("attendance_summary", "giving_summary", "expenses"):
+            db.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_tenant_service_key "
+                f"ON {table} (tenant_id, date, LOWER(COALESCE(service_type, '')));"
+            )
         db.commit()
 
 
+# ----------------------
+# Expense full-text search
+# ----------------------
+# Must match the GIN index expression exactly for Postgres to use the index
+EXPENSE_SEARCH_DOCUMENT = (
+    "to_tsvector('english', COALESCE(description, '') || ' ' || COALESCE(category, '') "
+    "|| ' ' || COALESCE(paid_by, ''))"
+)
+
+
+def expense_text_search(text):
+    """Backend-specific pieces for matching ``expenses e`` against free text.
+
+    Returns (join_sql, where_sql, rank_order_sql, params); params belong to
+    where_sql followed by rank_order_sql, in that order.
+    """
+    if is_sqlite():
+        # Quote each word so FTS5 syntax in user input is treated literally; prefix-match them
+        terms = " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+        return (
+            " JOIN expenses_fts ON expenses_fts.rowid = e.id",
+            "expenses_fts MATCH ?",
+            "bm25(expenses_fts)",
+            [terms],
+        )
+    document = EXPENSE_SEARCH_DOCUMENT.replace("COALESCE(", "COALESCE(e.")
+    return (
+        "",
+        f"{document} @@ websearch_to_tsquery('english', ?)",
+        f"ts_rank({document}, websearch_to_tsquery('english', ?)) DESC",
+        [text, text],
+    )
+
+
+# ----------------------
+# Idempotent form submissions
+# ----------------------
+def claim_submission(db, key, result):
+    """Claim a form's idempotency key inside the caller's (uncommitted) transaction.
+
+    Returns None when the key is new: the caller writes its rows and commits,
+    which also commits the claim. When the key was already used the transaction
+    is rolled back and the original submission's ``result`` is returned so the
+    caller can replay it instead of inserting again.
+    """
+    if not key:
+        return None
+    now = int(time.time())
+    if random.random() < 0.01:
+        db.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - IDEMPOTENCY_TTL_SECONDS,))
+    try:
+        db.execute("INSERT INTO idempotency_keys (key, result, created_at) VALUES (?, ?, ?)", (key, result, now))
+    except IntegrityError:
+        db.rollback()
+        row = db.execute("SELECT result FROM idempotency_keys WHERE key=?", (key,)).fetchone()
+        return row["result"] if row else result
+    return None
+
+
+# ----------------------
+# Period close helpers
+# ----------------------
+def month_of(date_str):
+    return (date_str or "")[:7]
+
+
+# Postgres advisory-lock namespace for lock_periods (the second key hashes the month)
+PERIOD_LOCK_NAMESPACE = 7301
+
+
+def lock_periods(db, dates=None, exclusive=False):
+    """Serialise writes to a month against closing it, until the transaction ends.
+
+    Entry paths call this before checking is_month_closed and keep the (shared)
+    lock through their commit; closing a month takes it exclusively. A close
+    therefore waits for entries that already passed the check, and entries that
+    start after it see the month closed. ``dates=None`` covers every month, for
+    bulk deletes. SQLite has no finer lock, so the whole write runs under
+    BEGIN IMMEDIATE there.
+    """
+    if not isinstance(db, PgConnection):
+        if not db.in_transaction:
+            db.execute("BEGIN IMMEDIATE")
+        return
+    if dates is None:
+        # Conflicts with the INSERT a close makes, and not with plain entries
+        db.execute("LOCK TABLE period_closes IN SHARE MODE")
+        return
+    lock = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    for month in sorted({month_of(d) for d in dates}):
+        db.execute(f"SELECT {lock}(?, hashtext(?))", (PERIOD_LOCK_NAMESPACE, month))
+
+
+def is_month_closed(db, date_str):
+    """True when the month containing ``date_str`` (YYYY-MM[-DD]) has been closed."""
+    row = db.execute("SELECT 1 FROM period_closes WHERE month=?", (month_of(date_str),)).fetchone()
+    return row is not None
+
+
+def closed_months_among(db, dates):
+    """The subset of months (YYYY-MM) covering ``dates`` that are closed, in one query."""
+    months = sorted({month_of(d) for d in dates})
+    if not months:
+        return set()
+    rows = db.execute(
+        f"SELECT month FROM period_closes WHERE month IN ({', '.join('?' for _ in months)})", months
+    ).fetchall()
+    return {r["month"] for r in rows}
+
+
+def closed_period_message(date_str):
+    return f"{month_of(date_str)} is closed. Ask finance to reopen the period before changing it."
+
+
+# ----------------------
+# Branches (tenants)
+# ----------------------
+def current_tenant_id():
+    """Branch the current request works in: the user's own, or the one an admin switched to."""
+    if not current_user.is_authenticated:
+        return DEFAULT_TENANT_ID
+    if current_user.role == "admin":
+        return session.get("tenant_id", current_user.tenant_id)
+    return current_user.tenant_id
+
+
+class TenantCache:
+    """Per-process TTL cache whose entries are partitioned by tenant id.
+
+    Values computed for one branch are only ever returned for that branch, and a
+    write in a branch drops just that branch's entries. Tenant ``None`` holds
+    organisation-wide values such as the branch list.
+    """
+
+    def __init__(self, ttl, max_entries_per_tenant=64):
+        self.ttl = ttl
+        self.max_entries = max_entries_per_tenant
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(tenant_id, {}).get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        value = compute()
+        with self._lock:
+            entries = self._entries.setdefault(tenant_id, {})
+            if len(entries) >= self.max_entries:
+                # Drop the entry closest to expiry
+                entries.pop(min(entries, key=lambda k: entries[k][0]))
+            entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, tenant_id):
+        with self._lock:
+            self._entries.pop(tenant_id, None)
+
+
+tenant_cache = TenantCache(TENANT_CACHE_SECONDS)
+
+
+def list_tenants(db=None):
+    """All branches as ``{"id", "name"}`` dicts (cached; only touches the database on a miss)."""
+    return tenant_cache.get(None, "tenants", lambda: [
+        dict(r) for r in (db or get_db()).execute("SELECT id, name FROM tenants ORDER BY name").fetchall()
+    ])
+
+
 # ----------------------
 # User model for Flask-Login
 # ----------------------
 class User(UserMixin):
-    def __init__(self, id, name, email, role, active=1):
+    def __init__(self, id, name, email, role, active=1, tenant_id=DEFAULT_TENANT_ID):
         self.id = id
         self.name = name
         self.email = email
         self.role = role
         self.active = active
+        self.tenant_id = tenant_id
 
     def is_active(self):
         return self.active == 1
@@ -107,54 +698,46 @@ class User(UserMixin):
 # ----------------------
 # User helpers
 # ----------------------
-def get_user_by_email(email):
-    with psycopg2.connect(DB_URL, cursor_factory=psycopg2.extras.RealDictCursor) as db:
-        with db.cursor() as cursor:
-            cursor.execute("SELECT * FROM users WHERE email=%s;", (email,))
-            user = cursor.fetchone()
-            if user:
-                return User(user['id'], user['name'], user['email'], user['role'], user['active'])
-    return None
-
-
 def load_user(user_id):
-    with psycopg2.connect(DB_URL, cursor_factory=psycopg2.extras.RealDictCursor) as db:
-        with db.cursor() as cursor:
-            cursor.execute("SELECT * FROM users WHERE id=%s;", (int(user_id),))
-            user = cursor.fetchone()
-            if user:
-                return User(user['id'], user['name'], user['email'], user['role'], user['active'])
+    with db_connection() as db:
+        user = db.execute("SELECT * FROM users WHERE id=?;", (int(user_id),)).fetchone()
+        if user:
+            return User(user['id'], user['name'], user['email'], user['role'], user['active'], user['tenant_id'])
     return None
 
 
-def create_user(name, email, password, role):
-    hashed_pw = generate_password_hash(password)
-    try:
-        with psycopg2.connect(DB_URL) as db:
-            with db.cursor() as cursor:
-                cursor.execute(
-                    "INSERT INTO users (name, email, password, role) VALUES (%s, %s, %s, %s);",
-                    (name, email, hashed_pw, role)
-                )
-                db.commit()
-                print(f"User {name} ({role}) created.")
-    except psycopg2.errors.UniqueViolation:
-        print(f"User {email} already exists.")
-
-
 # ----------------------
 # Idempotent default user seeding
 # ----------------------
+DEFAULT_USERS = [
+    ("Admin", "admin@church.com", "password123", "admin"),
+    ("John Usher", "usher@church.com", "password123", "usher"),
+    ("Mary Finance", "finance@church.com", "password123", "finance"),
+    ("Pastor Paul", "pastor@church.com", "password123", "pastor")
+]
+
+
 def seed_default_users():
-    defaults = [
-        ("Admin", "admin@church.com", "admin123", "admin"),
-        ("John Usher", "usher@church.com", "password123", "usher"),
-        ("Mary Finance", "finance@church.com", "password123", "finance"),
-        ("Pastor Paul", "pastor@church.com", "password123", "pastor")
-    ]
-
-    for name, email, password, role in defaults:
-        if not get_user_by_email(email):
-            create_user(name, email, password, role)
-
-    print("Default users checked/created successfully.")
+    """Create any missing default users: one lookup, one insert, one connection."""
+    emails = [email for _, email, _, _ in DEFAULT_USERS]
+    try:
+        with db_connection() as db:
+            existing = {row[0] for row in db.execute(
+                f"SELECT email FROM users WHERE email IN ({', '.join('?' for _ in emails)})", emails
+            ).fetchall()}
+            missing = [u for u in DEFAULT_USERS if u[1] not in existing]
+            if missing:
+                # Hashing is the slow part, so only hash for rows being inserted
+                insert_rows(db, "users", ("name", "email", "password", "role", "active"),
+                            [(name, email, generate_password_hash(password), role, 1)
+                             for name, email, password, role in missing])
+                db.commit()
+    except IntegrityError:
+        # Another worker seeded the same users concurrently
+        print("Default users were created by another process.")
+        return
+
+    if missing:
+        print(f"Created default users: {', '.join(u[1] for u in missing)}")
+    else:
+        print("All default users already exist.")
@@ -0,0 +1,156 @@
+"""Opt-in per-request profiling.
+
+Turned on with PROFILING_ENABLED=1; when it is off no hooks are registered at all.
+Once on, a request is profiled when
+
+* an admin sends the ``X-Profile: 1`` header or the ``?_profile=1`` query flag, or
+* it is picked by PROFILE_SAMPLE_RATE (0.0-1.0, default 0).
+
+Each captured request writes three files to PROFILE_DIR (default
+``<instance>/profiles``): ``.prof`` (pstats, open with ``python -m pstats`` or
+snakeviz), ``.collapsed`` (folded stacks for flamegraph.pl / speedscope) and a
+``.json`` summary. Only the newest PROFILE_MAX_FILES captures are kept.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_ARG = "_profile"
+
+
+def init_profiling(app):
+    app.config.setdefault("PROFILING_ENABLED", os.environ.get("PROFILING_ENABLED") == "1")
+    app.config.setdefault("PROFILE_SAMPLE_RATE", float(os.environ.get("PROFILE_SAMPLE_RATE", 0)))
+    app.config.setdefault("PROFILE_DIR", os.environ.get("PROFILE_DIR") or os.path.join(app.instance_path, "profiles"))
+    app.config.setdefault("PROFILE_MAX_FILES", int(os.environ.get("PROFILE_MAX_FILES", 200)))
+    # Seconds between stack samples for the collapsed-stack output
+    app.config.setdefault("PROFILE_STACK_INTERVAL", 0.001)
+
+    if not app.config["PROFILING_ENABLED"]:
+        return
+    app.before_request(_start_profile)
+    app.teardown_request(_finish_profile)
+
+
+def _wants_profile():
+    rate = current_app.config["PROFILE_SAMPLE_RATE"]
+    if rate and random.random() < rate:
+        return True
+    requested = request.headers.get(PROFILE_HEADER) == "1" or request.args.get(PROFILE_QUERY_ARG) == "1"
+    return requested and current_user.is_authenticated and current_user.role == "admin"
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into folded-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _start_profile():
+    if not _wants_profile():
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (debugger, coverage) already owns this thread
+        return
+    sampler = _StackSampler(threading.get_ident(), current_app.config["PROFILE_STACK_INTERVAL"])
+    sampler.start()
+    g._profile = (profiler, sampler, time.perf_counter())
+
+
+def _finish_profile(exc=None):
+    capture = g.pop("_profile", None)
+    if capture is None:
+        return
+    profiler, sampler, started = capture
+    profiler.disable()
+    sampler.stop()
+    duration_ms = (time.perf_counter() - started) * 1000
+    try:
+        _write_capture(profiler, sampler.stacks, duration_ms, exc)
+    except OSError as e:
+        current_app.logger.warning("Could not write request profile: %s", e)
+
+
+def _write_capture(profiler, stacks, duration_ms, exc):
+    directory = current_app.config["PROFILE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    endpoint = re.sub(r"[^A-Za-z0-9_.]+", "_", request.endpoint or "unknown")
+    base = os.path.join(directory, f"{int(time.time() * 1000)}-{endpoint}")
+
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".collapsed", "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".json", "w") as f:
+        json.dump({
+            "name": os.path.basename(base),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.endpoint,
+            "duration_ms": round(duration_ms, 1),
+            "user": current_user.email if current_user.is_authenticated else None,
+            "error": repr(exc) if exc else None,
+        }, f)
+    _rotate(directory, current_app.config["PROFILE_MAX_FILES"])
+
+
+def _rotate(directory, keep):
+    # Capture names start with a millisecond timestamp, so name order is age order
+    names = sorted(n[:-5] for n in os.listdir(directory) if n.endswith(".json"))
+    for name in names[:max(0, len(names) - keep)]:
+        for ext in (".json", ".prof", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, name + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures(directory, limit=50):
+    """Captured request summaries, slowest first."""
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    captures.sort(key=lambda c: c.get("duration_ms", 0), reverse=True)
+    return captures[:limit]
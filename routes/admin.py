@@ -1,8 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, send_from_directory, abort
 from forms import ClearDataForm
 from flask_login import login_required, current_user
-from models import get_db
-from routes.dashboard import role_required
+from models import get_db, is_month_closed, lock_periods, closed_period_message, current_tenant_id
+from routes.dashboard import role_required, OPEN_PERIOD
+from profiling import list_captures
+from audit import record, audit_stats
+from throttle import throttle_stats
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -13,55 +16,64 @@ def clear_data():
     if form.validate_on_submit():
         db = get_db()
         deleted = []
+        removed = {}
         try:
             date_filter = form.filter_date.data.strip() if form.filter_date.data else None
             service_type_filter = form.filter_service_type.data.strip().lower() if form.filter_service_type.data else None
 
+            # Closed months are never deleted here (OPEN_PERIOD); they must be reopened first.
+            # The lock keeps a month from being closed while its rows are being deleted.
+            lock_periods(db, [date_filter] if date_filter else None)
+            if date_filter and is_month_closed(db, date_filter):
+                flash(closed_period_message(date_filter), 'danger')
+                return redirect(url_for('dashboard.view_dashboard'))
+            kept_closed = db.execute('SELECT COUNT(*) FROM period_closes').fetchone()[0]
+            # Only the branch currently being worked in is cleared
+            tenant_id = current_tenant_id()
+
             if form.delete_attendance.data:
-                query = 'DELETE FROM attendance_summary'
-                params = []
-                if date_filter or service_type_filter:
-                    query += ' WHERE 1=1'
-                    if date_filter:
-                        query += ' AND date=?'
-                        params.append(date_filter)
-                    if service_type_filter:
-                        query += ' AND LOWER(service_type)=?'
-                        params.append(service_type_filter)
-                db.execute(query, params)
+                query = 'DELETE FROM attendance_summary WHERE tenant_id=? AND ' + OPEN_PERIOD
+                params = [tenant_id]
+                if date_filter:
+                    query += ' AND date=?'
+                    params.append(date_filter)
+                if service_type_filter:
+                    query += ' AND LOWER(service_type)=?'
+                    params.append(service_type_filter)
+                removed['attendance_summary'] = db.execute(query, params).rowcount
                 deleted.append('attendance')
 
             if form.delete_giving.data:
-                query = 'DELETE FROM giving_summary'
-                params = []
-                if date_filter or service_type_filter:
-                    query += ' WHERE 1=1'
-                    if date_filter:
-                        query += ' AND date=?'
-                        params.append(date_filter)
-                    if service_type_filter:
-                        query += ' AND LOWER(service_type)=?'
-                        params.append(service_type_filter)
-                db.execute(query, params)
+                query = 'DELETE FROM giving_summary WHERE tenant_id=? AND ' + OPEN_PERIOD
+                params = [tenant_id]
+                if date_filter:
+                    query += ' AND date=?'
+                    params.append(date_filter)
+                if service_type_filter:
+                    query += ' AND LOWER(service_type)=?'
+                    params.append(service_type_filter)
+                removed['giving_summary'] = db.execute(query, params).rowcount
                 deleted.append('giving')
 
             if form.delete_expenses.data:
-                query = 'DELETE FROM expenses'
-                params = []
-                if date_filter or service_type_filter:
-                    query += ' WHERE 1=1'
-                    if date_filter:
-                        query += ' AND date=?'
-                        params.append(date_filter)
-                    if service_type_filter:
-                        query += ' AND LOWER(service_type)=?'
-                        params.append(service_type_filter)
-                db.execute(query, params)
+                query = 'DELETE FROM expenses WHERE tenant_id=? AND ' + OPEN_PERIOD
+                params = [tenant_id]
+                if date_filter:
+                    query += ' AND date=?'
+                    params.append(date_filter)
+                if service_type_filter:
+                    query += ' AND LOWER(service_type)=?'
+                    params.append(service_type_filter)
+                removed['expenses'] = db.execute(query, params).rowcount
                 deleted.append('expenses')
 
             db.commit()
+            for table, rows in removed.items():
+                record('clear_data', table, rows=rows, date=date_filter, service_type=service_type_filter)
             if deleted:
                 flash(f"Deleted: {', '.join(deleted).title()}.", 'success')
+                if kept_closed and not date_filter:
+                    flash(f"Data in {kept_closed} closed month(s) was kept.", 'warning')
             else:
                 flash('No data type selected for deletion.', 'warning')
         except Exception as e:
@@ -69,3 +81,55 @@ def clear_data():
     else:
         flash('Invalid form submission.', 'danger')
     return redirect(url_for('dashboard.view_dashboard'))
+
+
+@admin_bp.route('/admin/profiles')
+@role_required(['admin'])
+def profiles():
+    captures = list_captures(current_app.config.get('PROFILE_DIR', ''))
+    return render_template('admin_profiles.html', captures=captures)
+
+
+@admin_bp.route('/admin/profiles/<filename>')
+@role_required(['admin'])
+def profile_download(filename):
+    if not filename.endswith(('.prof', '.collapsed')):
+        abort(404)
+    return send_from_directory(current_app.config['PROFILE_DIR'], filename, as_attachment=True)
+
+
+AUDIT_PAGE_SIZE = 50
+
+
+@admin_bp.route('/admin/audit')
+@role_required(['admin'])
+def audit_log():
+    db = get_db()
+    clauses, params = ['tenant_id=?'], [current_tenant_id()]
+    filters = {k: request.args.get(k, '').strip() for k in ('entity', 'action', 'actor')}
+    for column, value in filters.items():
+        if value:
+            clauses.append(f'{column}=?')
+            params.append(value)
+    # Keyset pagination: ?before=<id> continues below the last row shown
+    before = request.args.get('before', type=int)
+    if before:
+        clauses.append('id < ?')
+        params.append(before)
+    rows = db.execute(
+        'SELECT id, created_at, actor, action, entity, entity_id, details FROM audit_log WHERE '
+        + ' AND '.join(clauses) + ' ORDER BY id DESC LIMIT ?',
+        params + [AUDIT_PAGE_SIZE + 1]
+    ).fetchall()
+    next_before = rows[AUDIT_PAGE_SIZE - 1]['id'] if len(rows) > AUDIT_PAGE_SIZE else None
+    filter_args = {k: v for k, v in filters.items() if v}
+    return render_template(
+        'admin_audit.html', events=rows[:AUDIT_PAGE_SIZE], next_before=next_before,
+        filter_args=filter_args, stats=audit_stats(),
+    )
+
+
+@admin_bp.route('/admin/login-throttle')
+@role_required(['admin'])
+def login_throttle():
+    return render_template('admin_throttle.html', stats=throttle_stats())
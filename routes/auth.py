@@ -3,6 +3,7 @@ from models import get_db, load_user
 from werkzeug.security import check_password_hash
 from forms import LoginForm
 from flask_login import login_user, logout_user, login_required, current_user
+from throttle import check_login, login_failed, login_succeeded
 
 auth = Blueprint("auth", __name__)
 
@@ -13,6 +14,13 @@ def login():
         return redirect(url_for('dashboard.view_dashboard'))
 
     form = LoginForm()
+    if request.method == "POST":
+        # Before any lookup or hashing, so floods cost nothing but a bucket update
+        retry_after = check_login(request.remote_addr, request.form.get("email"))
+        if retry_after:
+            flash(f"Too many login attempts. Try again in {retry_after} seconds.", "danger")
+            return render_template("login.html", form=form), 429, {"Retry-After": str(retry_after)}
+
     if form.validate_on_submit():
         email = form.email.data
         password = form.password.data
@@ -26,9 +34,11 @@ def login():
         if user_row and check_password_hash(user_row["password"], password):
             user = load_user(user_row["id"])
             login_user(user)
+            login_succeeded(request.remote_addr, email)
             flash(f"Welcome {user.name}!", "success")
             return redirect(url_for("dashboard.view_dashboard"))
         else:
+            login_failed(request.remote_addr, email)
             flash("Invalid credentials", "danger")
 
     return render_template("login.html", form=form)
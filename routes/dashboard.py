@@ -1,9 +1,10 @@
 from flask import Blueprint, redirect, url_for, flash, render_template, request, make_response
 from flask_login import current_user, login_required
 from functools import wraps
-from models import get_db
+from models import get_db, get_read_db, current_tenant_id, tenant_cache, list_tenants, is_month_closed, closed_period_message, closed_months_among, lock_periods, insert_rows, claim_submission
 from datetime import datetime
-from forms import AttendanceForm, GivingForm, ClearDataForm
+from audit import record
+from forms import AttendanceForm, GivingForm, ClearDataForm, BatchAttendanceForm, BatchGivingForm, BATCH_MAX_ROWS
 import csv
 from io import StringIO
 from werkzeug.security import generate_password_hash
@@ -36,12 +37,34 @@ def role_required(allowed_roles):
 @login_required
 @role_required(["admin", "pastor", "usher", "finance"])
 def view_dashboard():
-    db = get_db()
+    db = get_read_db()
+    tenant_id = current_tenant_id()
+    # Aggregates are cached per branch and dropped whenever the branch writes
+    metrics = dict(tenant_cache.get(tenant_id, "dashboard_metrics", lambda: dashboard_metrics(db, tenant_id)))
+    recent_att = db.execute(
+        "SELECT date, service_type, male, female, children, total FROM attendance_summary WHERE tenant_id=? "
+        "ORDER BY date DESC, id DESC LIMIT 5", (tenant_id,)
+    ).fetchall()
+    recent_giv = db.execute(
+        "SELECT date, service_type, tithe, offering, special, entered_by FROM giving_summary WHERE tenant_id=? "
+        "ORDER BY date DESC, id DESC LIMIT 5", (tenant_id,)
+    ).fetchall()
+    recent_exp = db.execute(
+        "SELECT date, service_type, category, amount, payment_method, description, paid_by, approved FROM expenses "
+        "WHERE tenant_id=? ORDER BY date DESC, id DESC LIMIT 5", (tenant_id,)
+    ).fetchall()
+    form = ClearDataForm()
+    return render_template("dashboard.html", metrics=metrics, recent_attendance=recent_att, recent_giving=recent_giv, recent_expenses=recent_exp, form=form)
+
+
+def dashboard_metrics(db, tenant_id):
     # Example metrics (customize as needed)
-    total_members = db.execute("SELECT COUNT(*) FROM members").fetchone()[0]
-    total_users = db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    total_attendance = db.execute("SELECT COUNT(*) FROM attendance_summary").fetchone()[0]
-    total_giving = db.execute("SELECT SUM(tithe + offering + special) FROM giving_summary").fetchone()[0] or 0
+    total_members = db.execute("SELECT COUNT(*) FROM members WHERE tenant_id=?", (tenant_id,)).fetchone()[0]
+    total_users = db.execute("SELECT COUNT(*) FROM users WHERE tenant_id=?", (tenant_id,)).fetchone()[0]
+    total_attendance = db.execute("SELECT COUNT(*) FROM attendance_summary WHERE tenant_id=?", (tenant_id,)).fetchone()[0]
+    total_giving = db.execute(
+        "SELECT SUM(tithe + offering + special) FROM giving_summary WHERE tenant_id=?", (tenant_id,)
+    ).fetchone()[0] or 0
     metrics = {
         "total_members": total_members,
         "total_users": total_users,
@@ -51,7 +74,8 @@ def view_dashboard():
 
     # Compute last attendance metrics for usher/pastor cards
     last_att_row = db.execute(
-        "SELECT date, service_type, total FROM attendance_summary ORDER BY date DESC, id DESC LIMIT 1"
+        "SELECT date, service_type, total FROM attendance_summary WHERE tenant_id=? ORDER BY date DESC, id DESC LIMIT 1",
+        (tenant_id,)
     ).fetchone()
     if last_att_row:
         metrics.update({
@@ -66,7 +90,9 @@ def view_dashboard():
 
     # Compute last giving metrics for finance card
     last_giving_row = db.execute(
-        "SELECT date, service_type, tithe, offering, special FROM giving_summary ORDER BY date DESC, id DESC LIMIT 1"
+        "SELECT date, service_type, tithe, offering, special FROM giving_summary WHERE tenant_id=? "
+        "ORDER BY date DESC, id DESC LIMIT 1",
+        (tenant_id,)
     ).fetchone()
     if last_giving_row:
         last_giving_total = (last_giving_row['tithe'] or 0) + (last_giving_row['offering'] or 0) + (last_giving_row['special'] or 0)
@@ -81,23 +107,17 @@ def view_dashboard():
         })
 
     # Compute expense-related metrics for dashboard badges and summaries
-    pending_expenses = db.execute("SELECT COUNT(*) FROM expenses WHERE approved=0").fetchone()[0]
-    approved_expenses_total = db.execute("SELECT SUM(amount) FROM expenses WHERE approved=1").fetchone()[0] or 0.0
+    pending_expenses = db.execute(
+        "SELECT COUNT(*) FROM expenses WHERE tenant_id=? AND approved=0", (tenant_id,)
+    ).fetchone()[0]
+    approved_expenses_total = db.execute(
+        "SELECT SUM(amount) FROM expenses WHERE tenant_id=? AND approved=1", (tenant_id,)
+    ).fetchone()[0] or 0.0
     metrics.update({
         "pending_expenses": pending_expenses,
         "approved_expenses_total": approved_expenses_total,
     })
-    recent_att = db.execute(
-        "SELECT date, service_type, male, female, children, total FROM attendance_summary ORDER BY date DESC, id DESC LIMIT 5"
-    ).fetchall()
-    recent_giv = db.execute(
-        "SELECT date, service_type, tithe, offering, special, entered_by FROM giving_summary ORDER BY date DESC, id DESC LIMIT 5"
-    ).fetchall()
-    recent_exp = db.execute(
-        "SELECT date, service_type, category, amount, payment_method, description, paid_by, approved FROM expenses ORDER BY date DESC, id DESC LIMIT 5"
-    ).fetchall()
-    form = ClearDataForm()
-    return render_template("dashboard.html", metrics=metrics, recent_attendance=recent_att, recent_giving=recent_giv, recent_expenses=recent_exp, form=form)
+    return metrics
 
 
 # ---------------------------
@@ -108,32 +128,35 @@ def view_dashboard():
 @role_required(["admin", "pastor", "usher", "finance"])
 def download_report_csv():
     month = request.args.get('month')  # format: YYYY-MM
-    db = get_db()
+    try:
+        datetime.strptime(month or '', '%Y-%m')
+    except ValueError:
+        flash("Choose a month to download.", "danger")
+        return redirect(url_for("dashboard.reports"))
+    db = get_read_db()
+    tenant_id = current_tenant_id()
     output = StringIO()
     writer = csv.writer(output)
 
-    # Per-service balance: for each (date, service_type), sum giving and approved expenses for the selected month
+    # Per-service balance: for each (date, service_type), sum giving and approved expenses for the selected month.
+    # Closed months are read straight from their snapshot.
     writer.writerow(['Date', 'Service Type', 'Total Giving', 'Approved Expenses', 'Balance'])
-    giving_data = db.execute(
-        "SELECT date, service_type, SUM(tithe), SUM(offering), SUM(special) FROM giving_summary WHERE date LIKE ? GROUP BY date, service_type ORDER BY date DESC",
-        (f'{month}%',)
-    ).fetchall()
-    for g in giving_data:
-        date, service_type, tithe, offering, special = g
-        norm_service_type = (service_type or '').lower()
-        total_giving = (tithe or 0) + (offering or 0) + (special or 0)
-        exp_row = db.execute(
-            "SELECT SUM(amount) FROM expenses WHERE date=? AND LOWER(service_type)=? AND approved=1",
-            (date, norm_service_type)
-        ).fetchone()
-        total_expenses = exp_row[0] or 0
-        balance = total_giving - total_expenses
+    if is_month_closed(db, month):
+        services = db.execute(
+            "SELECT * FROM service_snapshots WHERE tenant_id=? AND month=? ORDER BY date DESC, service_type DESC",
+            (tenant_id, month)
+        ).fetchall()
+    else:
+        services = compute_service_totals(db, month, tenant_id)
+    for s in services:
+        if not s['giving_entries']:
+            continue
         writer.writerow([
-            date,
-            service_type,
-            f"{total_giving:,.2f}",
-            f"{total_expenses:,.2f}",
-            f"{balance:,.2f}"
+            s['date'],
+            s['service_type'],
+            f"{s['total_giving']:,.2f}",
+            f"{s['total_expenses']:,.2f}",
+            f"{s['balance']:,.2f}"
         ])
 
     output.seek(0)
@@ -157,8 +180,10 @@ class UserForm(FlaskForm):
 @dashboard.route("/users")
 @role_required(["admin"])
 def users_list():
-    db = get_db()
-    users = db.execute("SELECT id, name, email, role, active FROM users ORDER BY name").fetchall()
+    db = get_read_db()
+    users = db.execute(
+        "SELECT id, name, email, role, active FROM users WHERE tenant_id=? ORDER BY name", (current_tenant_id(),)
+    ).fetchall()
     return render_template("users_list.html", users=users)
 
 
@@ -171,10 +196,12 @@ def users_new():
         hashed_pw = generate_password_hash(form.password.data) if form.password.data else None
         try:
             db.execute(
-                "INSERT INTO users (name, email, password, role, active) VALUES (?, ?, ?, ?, ?)",
-                (form.name.data, form.email.data, hashed_pw or '', form.role.data, int(form.active.data))
+                "INSERT INTO users (name, email, password, role, active, tenant_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (form.name.data, form.email.data, hashed_pw or '', form.role.data, int(form.active.data),
+                 current_tenant_id())
             )
             db.commit()
+            record("insert", "users", email=form.email.data, role=form.role.data, active=int(form.active.data))
             flash("User added.", "success")
             return redirect(url_for("dashboard.users_list"))
         except Exception as e:
@@ -186,7 +213,7 @@ def users_new():
 @role_required(["admin"])
 def users_edit(user_id):
     db = get_db()
-    user = db.execute("SELECT * FROM users WHERE id=?", (user_id,)).fetchone()
+    user = db.execute("SELECT * FROM users WHERE id=? AND tenant_id=?", (user_id, current_tenant_id())).fetchone()
     if not user:
         flash("User not found.", "danger")
         return redirect(url_for("dashboard.users_list"))
@@ -199,6 +226,11 @@ def users_edit(user_id):
                 (form.name.data, form.email.data, hashed_pw, form.role.data, int(form.active.data), user_id)
             )
             db.commit()
+            new_values = {"name": form.name.data, "email": form.email.data, "role": form.role.data,
+                          "active": int(form.active.data)}
+            record("update", "users", user_id,
+                   changes={k: [user[k], v] for k, v in new_values.items() if user[k] != v},
+                   password_changed=bool(form.password.data))
             flash("User updated.", "success")
             return redirect(url_for("dashboard.users_list"))
         except Exception as e:
@@ -211,8 +243,11 @@ def users_edit(user_id):
 
 def users_delete(user_id):
     db = get_db()
-    db.execute("DELETE FROM users WHERE id=?", (user_id,))
+    user = db.execute("SELECT email, role FROM users WHERE id=? AND tenant_id=?", (user_id, current_tenant_id())).fetchone()
+    db.execute("DELETE FROM users WHERE id=? AND tenant_id=?", (user_id, current_tenant_id()))
     db.commit()
+    if user:
+        record("delete", "users", user_id, email=user["email"], role=user["role"])
     flash("User deleted.", "success")
     return redirect(url_for("dashboard.users_list"))
 
@@ -223,9 +258,10 @@ def users_delete(user_id):
 @dashboard.route("/members")
 @role_required(["pastor"])
 def members_list():
-    db = get_db()
+    db = get_read_db()
     members = db.execute(
-        "SELECT id, name, email, phone, joined_date, active FROM members ORDER BY name"
+        "SELECT id, name, email, phone, joined_date, active FROM members WHERE tenant_id=? ORDER BY name",
+        (current_tenant_id(),)
     ).fetchall()
     return render_template("members_list.html", members=members)
 
@@ -241,10 +277,11 @@ def members_new():
         if name:
             db = get_db()
             db.execute(
-                "INSERT INTO members (name, email, phone, joined_date, active) VALUES (?, ?, ?, ?, 1)",
-                (name, email, phone, joined_date)
+                "INSERT INTO members (name, email, phone, joined_date, active, tenant_id) VALUES (?, ?, ?, ?, 1, ?)",
+                (name, email, phone, joined_date, current_tenant_id())
             )
             db.commit()
+            record("insert", "members", name=name, email=email)
             flash("Member added", "success")
             return redirect(url_for("dashboard.members_list"))
         else:
@@ -258,10 +295,11 @@ def members_toggle(member_id):
     db = get_db()
     # Toggle active flag
     db.execute(
-        "UPDATE members SET active = CASE WHEN active=1 THEN 0 ELSE 1 END WHERE id=?",
-        (member_id,)
+        "UPDATE members SET active = CASE WHEN active=1 THEN 0 ELSE 1 END WHERE id=? AND tenant_id=?",
+        (member_id, current_tenant_id())
     )
     db.commit()
+    record("toggle_active", "members", member_id)
     flash("Member status updated", "success")
     return redirect(url_for("dashboard.members_list"))
 
@@ -300,18 +338,30 @@ def attendance():
         total = male + female + children
 
         db = get_db()
-        db.execute(
-            "INSERT INTO attendance_summary (date, service_type, male, female, children, total) VALUES (?, ?, ?, ?, ?, ?)",
-            (date, service_type, male, female, children, total)
-        )
-        db.commit()
-        flash(f"Attendance for {date} saved successfully.", "success")
-        return redirect(url_for("dashboard.attendance"))
+        lock_periods(db, [date])
+        if is_month_closed(db, date):
+            flash(closed_period_message(date), "danger")
+        else:
+            saved_message = f"Attendance for {date} saved successfully."
+            # A retried/double-tapped submit replays the original result instead of inserting again
+            replayed = claim_submission(db, form.idempotency_key.data, saved_message)
+            if replayed is None:
+                db.execute(
+                    "INSERT INTO attendance_summary (date, service_type, male, female, children, total, tenant_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (date, service_type, male, female, children, total, current_tenant_id())
+                )
+                db.commit()
+                record("insert", "attendance_summary", date=date, service_type=service_type, total=total)
+            flash(replayed or saved_message, "success")
+            return redirect(url_for("dashboard.attendance"))
 
     # fetch recent attendance entries for display
     db = get_db()
     recent_attendance = db.execute(
-        "SELECT date, service_type, male, female, children, total FROM attendance_summary ORDER BY date DESC, id DESC LIMIT 5"
+        "SELECT date, service_type, male, female, children, total FROM attendance_summary WHERE tenant_id=? "
+        "ORDER BY date DESC, id DESC LIMIT 5",
+        (current_tenant_id(),)
     ).fetchall()
 
     return render_template("attendance.html", form=form, message=message, recent_attendance=recent_attendance)
@@ -341,23 +391,176 @@ def giving():
         entered_by = current_user.name
 
         db = get_db()
-        db.execute(
-            "INSERT INTO giving_summary (date, service_type, tithe, offering, special, entered_by) VALUES (?, ?, ?, ?, ?, ?)",
-            (date, service_type, tithe, offering, special, entered_by)
-        )
-        db.commit()
-        flash(f"Tithe & Offering for {date} saved successfully.", "success")
-        return redirect(url_for("dashboard.giving"))
+        lock_periods(db, [date])
+        if is_month_closed(db, date):
+            flash(closed_period_message(date), "danger")
+        else:
+            saved_message = f"Tithe & Offering for {date} saved successfully."
+            replayed = claim_submission(db, form.idempotency_key.data, saved_message)
+            if replayed is None:
+                db.execute(
+                    "INSERT INTO giving_summary (date, service_type, tithe, offering, special, entered_by, tenant_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (date, service_type, tithe, offering, special, entered_by, current_tenant_id())
+                )
+                db.commit()
+                record("insert", "giving_summary", date=date, service_type=service_type,
+                       tithe=tithe, offering=offering, special=special)
+            flash(replayed or saved_message, "success")
+            return redirect(url_for("dashboard.giving"))
 
     # fetch recent giving entries for display
     db = get_db()
     recent_giving = db.execute(
-        "SELECT date, service_type, tithe, offering, special, entered_by FROM giving_summary ORDER BY date DESC, id DESC LIMIT 5"
+        "SELECT date, service_type, tithe, offering, special, entered_by FROM giving_summary WHERE tenant_id=? "
+        "ORDER BY date DESC, id DESC LIMIT 5",
+        (current_tenant_id(),)
     ).fetchall()
 
     return render_template("giving.html", form=form, message=message, recent_giving=recent_giving)
 
 
+# ---------------------------
+# Batch Entry (grid of services, one transaction)
+# ---------------------------
+def _add_batch_rows(form):
+    # ?rows=N asks for a bigger grid on GET (the FieldList already has its minimum)
+    try:
+        wanted = min(int(request.args.get("rows", 0)), BATCH_MAX_ROWS)
+    except ValueError:
+        wanted = 0
+    while len(form.rows) < wanted:
+        form.rows.append_entry()
+
+
+def validate_batch_rows(db, form, number_fields, parse_number):
+    """Check every filled-in grid row before anything is written.
+
+    Blank rows are ignored. Returns one result dict per filled row; the batch may
+    only be saved when no row has errors.
+    """
+    results = []
+    for line, entry in enumerate(form.rows.entries, start=1):
+        raw = {name: (entry.form[name].data or "").strip() for name in ("date", "service_type") + number_fields}
+        if not any(raw.values()):
+            continue
+        errors, values = [], {}
+        try:
+            date = datetime.strptime(raw["date"], "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            date = raw["date"]
+            errors.append("date must be YYYY-MM-DD")
+        if not raw["service_type"]:
+            errors.append("service type is required")
+        for name in number_fields:
+            try:
+                values[name] = parse_number(raw[name] or 0)
+                if values[name] < 0:
+                    raise ValueError
+            except ValueError:
+                errors.append(f"{name} must be a non-negative number")
+        results.append({"line": line, "date": date, "service_type": raw["service_type"],
+                        "values": values, "errors": errors})
+
+    dates = [r["date"] for r in results if not r["errors"]]
+    lock_periods(db, dates)
+    closed = closed_months_among(db, dates)
+    for r in results:
+        if not r["errors"] and r["date"][:7] in closed:
+            r["errors"].append(closed_period_message(r["date"]))
+    return results
+
+
+def _batch_outcome(results, saved):
+    for r in results:
+        if r["errors"]:
+            r["status"] = "Error: " + "; ".join(r["errors"])
+        else:
+            r["status"] = "Saved" if saved else "Not saved (other rows have errors)"
+    return results
+
+
+@dashboard.route("/attendance/batch", methods=["GET", "POST"])
+@role_required(["usher"])
+def attendance_batch():
+    form = BatchAttendanceForm()
+    results = None
+    if form.validate_on_submit():
+        db = get_db()
+        results = validate_batch_rows(db, form, ("male", "female", "children"), int)
+        ok = bool(results) and not any(r["errors"] for r in results)
+        saved_message = f"Saved attendance for {len(results)} service(s)."
+        replayed = claim_submission(db, form.idempotency_key.data, saved_message) if ok else None
+        if replayed is not None:
+            flash(replayed, "success")
+            results, form = None, BatchAttendanceForm(formdata=None)
+        elif ok:
+            insert_rows(
+                db, "attendance_summary", ("date", "service_type", "male", "female", "children", "total", "tenant_id"),
+                [(r["date"], r["service_type"], r["values"]["male"], r["values"]["female"], r["values"]["children"],
+                  sum(r["values"].values()), current_tenant_id()) for r in results]
+            )
+            db.commit()
+            record("batch_insert", "attendance_summary", rows=len(results),
+                   dates=sorted({r["date"] for r in results}))
+            flash(saved_message, "success")
+            form = BatchAttendanceForm(formdata=None)
+        elif not results:
+            flash("Fill in at least one row.", "danger")
+        else:
+            flash("Nothing was saved. Fix the rows marked below and submit again.", "danger")
+        if results is not None:
+            results = _batch_outcome(results, ok)
+    elif request.method == "GET":
+        _add_batch_rows(form)
+
+    return render_template(
+        "batch_entry.html", form=form, results=results, title="Batch Attendance Entry",
+        number_fields=("male", "female", "children"), step="1", single_url=url_for("dashboard.attendance"),
+    )
+
+
+@dashboard.route("/giving/batch", methods=["GET", "POST"])
+@role_required(["finance"])
+def giving_batch():
+    form = BatchGivingForm()
+    results = None
+    if form.validate_on_submit():
+        db = get_db()
+        results = validate_batch_rows(db, form, ("tithe", "offering", "special"), float)
+        ok = bool(results) and not any(r["errors"] for r in results)
+        saved_message = f"Saved giving for {len(results)} service(s)."
+        replayed = claim_submission(db, form.idempotency_key.data, saved_message) if ok else None
+        if replayed is not None:
+            flash(replayed, "success")
+            results, form = None, BatchGivingForm(formdata=None)
+        elif ok:
+            insert_rows(
+                db, "giving_summary", ("date", "service_type", "tithe", "offering", "special", "entered_by", "tenant_id"),
+                [(r["date"], r["service_type"].lower(), r["values"]["tithe"], r["values"]["offering"],
+                  r["values"]["special"], current_user.name, current_tenant_id()) for r in results]
+            )
+            db.commit()
+            record("batch_insert", "giving_summary", rows=len(results),
+                   dates=sorted({r["date"] for r in results}),
+                   total=sum(sum(r["values"].values()) for r in results))
+            flash(saved_message, "success")
+            form = BatchGivingForm(formdata=None)
+        elif not results:
+            flash("Fill in at least one row.", "danger")
+        else:
+            flash("Nothing was saved. Fix the rows marked below and submit again.", "danger")
+        if results is not None:
+            results = _batch_outcome(results, ok)
+    elif request.method == "GET":
+        _add_batch_rows(form)
+
+    return render_template(
+        "batch_entry.html", form=form, results=results, title="Batch Tithe & Offering Entry",
+        number_fields=("tithe", "offering", "special"), step="0.01", single_url=url_for("dashboard.giving"),
+    )
+
+
 # ---------------------------
 # Expense Approval (Pastor only)
 # ---------------------------
@@ -365,32 +568,48 @@ def giving():
 @role_required(["pastor"])
 def approve_expenses():
     db = get_db()
+    tenant_id = current_tenant_id()
     message = ""
 
     if request.method == "POST":
         # Get expense ID from form
         expense_id = int(request.form["expense_id"])
-        db.execute("UPDATE expenses SET approved=1 WHERE id=?", (expense_id,))
-        db.commit()
-        message = f"Expense ID {expense_id} approved successfully."
+        row = db.execute("SELECT date FROM expenses WHERE id=? AND tenant_id=?", (expense_id, tenant_id)).fetchone()
+        if row:
+            lock_periods(db, [row["date"]])
+        if row and is_month_closed(db, row["date"]):
+            message = closed_period_message(row["date"])
+        else:
+            cursor = db.execute(
+                "UPDATE expenses SET approved=1 WHERE id=? AND tenant_id=? AND approved=0", (expense_id, tenant_id)
+            )
+            db.commit()
+            if cursor.rowcount:
+                record("approve", "expenses", expense_id)
+                message = f"Expense ID {expense_id} approved successfully."
+            else:
+                message = f"Expense ID {expense_id} not found or already approved."
 
     # Fetch all pending expenses
     pending_expenses = db.execute(
         "SELECT id, date, service_type, category, amount, payment_method, description, paid_by "
-        "FROM expenses WHERE approved=0"
+        "FROM expenses WHERE tenant_id=? AND approved=0",
+        (tenant_id,)
     ).fetchall()
 
     # Show per-service balance for the most recent 5 services
     balance_data = []
     giving_data = db.execute(
-        "SELECT date, service_type, SUM(tithe), SUM(offering), SUM(special) FROM giving_summary GROUP BY date, service_type ORDER BY date DESC LIMIT 5"
+        "SELECT date, service_type, SUM(tithe), SUM(offering), SUM(special) FROM giving_summary WHERE tenant_id=? "
+        "GROUP BY date, service_type ORDER BY date DESC LIMIT 5",
+        (tenant_id,)
     ).fetchall()
     for g in giving_data:
         date, service_type, tithe, offering, special = g
         total_giving = (tithe or 0) + (offering or 0) + (special or 0)
         exp_row = db.execute(
-            "SELECT SUM(amount) FROM expenses WHERE date=? AND service_type=? AND approved=1",
-            (date, service_type)
+            "SELECT SUM(amount) FROM expenses WHERE tenant_id=? AND date=? AND service_type=? AND approved=1",
+            (tenant_id, date, service_type)
         ).fetchone()
         total_expenses = exp_row[0] or 0
         balance = total_giving - total_expenses
@@ -406,53 +625,430 @@ def approve_expenses():
 
 
 # ---------------------------
-# Reports Page (All roles listed)
+# Reports helpers (filters + keyset pagination)
 # ---------------------------
-@dashboard.route("/reports")
-@role_required(["admin", "pastor", "usher", "finance"])
-def reports():
-    db = get_db()
+REPORT_PAGE_SIZE = 25
+REPORT_SECTIONS = ("balance", "attendance", "giving", "expenses")
+SERVICE_KEY = "LOWER(COALESCE(service_type, ''))"
+# Rows outside closed months; closed months are served from service_snapshots
+OPEN_PERIOD = "SUBSTR(date, 1, 7) NOT IN (SELECT month FROM period_closes)"
 
-    # Attendance summary: total per service date
-    attendance_data = db.execute(
-        "SELECT date, service_type, male, female, children, total FROM attendance_summary ORDER BY date DESC"
-    ).fetchall()
 
-    # Giving summary: totals per service date
-    giving_data = db.execute(
-        "SELECT date, service_type, SUM(tithe), SUM(offering), SUM(special) FROM giving_summary GROUP BY date, service_type ORDER BY date DESC"
+def open_period_ranges(db):
+    """The dates outside closed months as ``[(start, end)]`` ranges (start inclusive, end
+    exclusive, None = unbounded), so live queries can seek the date index instead of
+    testing every row against period_closes."""
+    ranges, start = [], None
+    for (month,) in db.execute("SELECT month FROM period_closes ORDER BY month").fetchall():
+        year, mon = int(month[:4]), int(month[5:7])
+        month_start = f"{month}-01"
+        if start != month_start:
+            ranges.append((start, month_start))
+        start = f"{year + mon // 12:04d}-{mon % 12 + 1:02d}-01"
+    ranges.append((start, None))
+    return ranges
+
+
+def _parse_date_arg(name):
+    value = (request.args.get(name) or "").strip()
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def report_filters():
+    """Branch, date-range and service-type filters shared by every report section."""
+    return {
+        "tenant_id": current_tenant_id(),
+        "date_from": _parse_date_arg("date_from"),
+        "date_to": _parse_date_arg("date_to"),
+        "service_type": (request.args.get("service_type") or "").strip().lower() or None,
+    }
+
+
+def filter_clauses(filters, date_col="date", service_col="service_type", tenant_col="tenant_id"):
+    clauses, params = [], []
+    # Branch first, matching the tenant-leading indexes
+    if filters.get("tenant_id") is not None:
+        clauses.append(f"{tenant_col} = ?")
+        params.append(filters["tenant_id"])
+    if filters.get("date_from"):
+        clauses.append(f"{date_col} >= ?")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        clauses.append(f"{date_col} <= ?")
+        params.append(filters["date_to"])
+    if filters.get("service_type"):
+        clauses.append(f"LOWER({service_col}) = ?")
+        params.append(filters["service_type"])
+    return clauses, params
+
+
+def where_sql(clauses):
+    return (" WHERE " + " AND ".join(clauses)) if clauses else ""
+
+
+def encode_cursor(date, key):
+    return f"{date}|{key}"
+
+
+def decode_cursor(value, numeric=False):
+    """Split a ``date|key`` cursor; returns None for missing or tampered values."""
+    if not value or "|" not in value:
+        return None
+    date, key = value.split("|", 1)
+    if numeric:
+        try:
+            key = int(key)
+        except ValueError:
+            return None
+    return date, key
+
+
+def _page(rows, limit, cursor_of):
+    # Each query fetches limit + 1 rows; the extra row only signals a next page.
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, cursor_of(rows[-1])
+    return rows, None
+
+
+def attendance_page(db, filters, cursor=None, limit=REPORT_PAGE_SIZE):
+    clauses, params = filter_clauses(filters)
+    if cursor:
+        clauses.append("(date, id) < (?, ?)")
+        params.extend(cursor)
+    rows = db.execute(
+        "SELECT id, date, service_type, male, female, children, total FROM attendance_summary"
+        + where_sql(clauses) + " ORDER BY date DESC, id DESC LIMIT ?",
+        params + [limit + 1]
     ).fetchall()
+    return _page(rows, limit, lambda r: encode_cursor(r["date"], r["id"]))
 
-    # Expenses summary: detailed approved expenses grouped by date and service_type
-    expenses_data = db.execute(
-        "SELECT date, service_type, category, amount, payment_method, description, paid_by "
-        "FROM expenses WHERE approved=1 ORDER BY date DESC, service_type"
+
+def giving_page(db, filters, cursor=None, limit=REPORT_PAGE_SIZE):
+    """Giving per service: closed months come from service_snapshots, open months are aggregated live.
+
+    Snapshot rows also carry their frozen ``total_expenses``; live rows leave it NULL.
+    The snapshots and each open date range are read as separate keysets of at most
+    ``limit + 1`` rows in index order, then merged, so a page never sorts the whole history.
+    """
+    clauses, params = filter_clauses(filters)
+    if cursor:
+        clauses.append(f"(date, {SERVICE_KEY}) < (?, ?)")
+        params.extend(cursor)
+    arms = [(
+        "SELECT date, service_type, tithe, offering, special, total_expenses FROM service_snapshots"
+        + where_sql(clauses + ["giving_entries > 0"]) + " ORDER BY date DESC, service_type DESC LIMIT ?",
+        params + [limit + 1]
+    )]
+    for start, end in open_period_ranges(db):
+        live_clauses, live_params = list(clauses), list(params)
+        if start:
+            live_clauses.append("date >= ?")
+            live_params.append(start)
+        if end:
+            live_clauses.append("date < ?")
+            live_params.append(end)
+        arms.append((
+            f"SELECT date, {SERVICE_KEY} AS service_type, SUM(tithe) AS tithe, SUM(offering) AS offering,"
+            " SUM(special) AS special, CAST(NULL AS REAL) AS total_expenses FROM giving_summary"
+            + where_sql(live_clauses)
+            + f" GROUP BY date, {SERVICE_KEY} ORDER BY date DESC, {SERVICE_KEY} DESC LIMIT ?",
+            live_params + [limit + 1]
+        ))
+    rows = db.execute(
+        "SELECT date, service_type, tithe, offering, special, total_expenses FROM ("
+        + " UNION ALL ".join(f"SELECT * FROM ({sql}) arm_{i}" for i, (sql, _) in enumerate(arms))
+        + ") per_service ORDER BY date DESC, service_type DESC LIMIT ?",
+        [p for _, arm_params in arms for p in arm_params] + [limit + 1]
     ).fetchall()
+    return _page(rows, limit, lambda r: encode_cursor(r["date"], r["service_type"]))
+
+
+def balance_page(db, filters, cursor=None, limit=REPORT_PAGE_SIZE):
+    """Per-service balance: one page of giving groups plus one grouped expense lookup."""
+    groups, next_cursor = giving_page(db, filters, cursor, limit)
+    if not groups:
+        return [], None
+
+    # A single aggregate bounded to the page's date window replaces the per-row lookups;
+    # snapshot rows already carry their frozen expense totals.
+    live = [g for g in groups if g["total_expenses"] is None]
+    expenses_by_service = {}
+    if live:
+        clauses, params = filter_clauses(filters)
+        clauses += ["approved=1", "date >= ?", "date <= ?", OPEN_PERIOD]
+        params += [live[-1]["date"], live[0]["date"]]
+        expense_rows = db.execute(
+            f"SELECT date, {SERVICE_KEY} AS service_type, SUM(amount) AS total_expenses "
+            "FROM expenses" + where_sql(clauses)
+            + f" GROUP BY date, {SERVICE_KEY}",
+            params
+        ).fetchall()
+        expenses_by_service = {(r["date"], r["service_type"]): r["total_expenses"] or 0 for r in expense_rows}
 
-    # Per-service balance: for each (date, service_type), sum giving and approved expenses
     balance_data = []
-    for g in giving_data:
-        date, service_type, tithe, offering, special = g
-        norm_service_type = (service_type or '').lower()
-        total_giving = (tithe or 0) + (offering or 0) + (special or 0)
-        exp_row = db.execute(
-            "SELECT SUM(amount) FROM expenses WHERE date=? AND LOWER(service_type)=? AND approved=1",
-            (date, norm_service_type)
-        ).fetchone()
-        total_expenses = exp_row[0] or 0
-        balance = total_giving - total_expenses
+    for g in groups:
+        total_giving = (g["tithe"] or 0) + (g["offering"] or 0) + (g["special"] or 0)
+        total_expenses = g["total_expenses"]
+        if total_expenses is None:
+            total_expenses = expenses_by_service.get((g["date"], g["service_type"]), 0)
         balance_data.append({
-            'date': date,
-            'service_type': service_type,
+            'date': g["date"],
+            'service_type': g["service_type"],
             'total_giving': total_giving,
             'total_expenses': total_expenses,
-            'balance': balance
+            'balance': total_giving - total_expenses
         })
+    return balance_data, next_cursor
+
 
+def approved_expenses_page(db, filters, cursor=None, limit=REPORT_PAGE_SIZE):
+    clauses, params = filter_clauses(filters)
+    clauses.append("approved=1")
+    if cursor:
+        clauses.append("(date, id) < (?, ?)")
+        params.extend(cursor)
+    rows = db.execute(
+        "SELECT id, date, service_type, category, amount, payment_method, description, paid_by, approved_by "
+        "FROM expenses" + where_sql(clauses) + " ORDER BY date DESC, id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+    return _page(rows, limit, lambda r: encode_cursor(r["date"], r["id"]))
+
+
+REPORT_PAGE_LOADERS = {
+    "balance": (balance_page, False),
+    "attendance": (attendance_page, True),
+    "giving": (giving_page, False),
+    "expenses": (approved_expenses_page, True),
+}
+
+
+# ---------------------------
+# Reports Page (All roles listed)
+# ---------------------------
+@dashboard.route("/reports")
+@role_required(["admin", "pastor", "usher", "finance"])
+def reports():
+    db = get_read_db()
+    filters = report_filters()
+
+    # ?section=<name> renders just that section; used by the "Load more" links.
+    section = request.args.get("section")
+    sections = (section,) if section in REPORT_SECTIONS else REPORT_SECTIONS
+
+    pages = {}
+    for name in sections:
+        loader, numeric_key = REPORT_PAGE_LOADERS[name]
+        cursor = decode_cursor(request.args.get(f"{name}_after"), numeric=numeric_key)
+        rows, next_cursor = loader(db, filters, cursor)
+        pages[name] = {"rows": rows, "next": next_cursor}
+
+    filter_args = {k: v for k, v in request.args.items() if k in ("date_from", "date_to", "service_type") and v}
     return render_template(
         "reports.html",
-        attendance_data=attendance_data,
-        giving_data=giving_data,
-        expenses_data=expenses_data,
-        balance_data=balance_data
+        pages=pages,
+        section=section if section in REPORT_SECTIONS else None,
+        filter_args=filter_args,
+    )
+
+
+# ---------------------------
+# Cross-branch rollup (Admin)
+# ---------------------------
+ROLLUP_TOTALS = ("services", "attendance", "total_giving", "total_expenses", "balance")
+
+
+def tenant_totals(db, tenant_id, filters):
+    """Headline totals for one branch over the filtered range."""
+    clauses, params = filter_clauses(dict(filters, tenant_id=tenant_id))
+    attendance = db.execute(
+        "SELECT COUNT(*) AS services, COALESCE(SUM(total), 0) AS attendance FROM attendance_summary"
+        + where_sql(clauses), params
+    ).fetchone()
+    total_giving = db.execute(
+        "SELECT COALESCE(SUM(COALESCE(tithe, 0) + COALESCE(offering, 0) + COALESCE(special, 0)), 0) "
+        "FROM giving_summary" + where_sql(clauses), params
+    ).fetchone()[0]
+    total_expenses = db.execute(
+        "SELECT COALESCE(SUM(amount), 0) FROM expenses" + where_sql(clauses + ["approved=1"]), params
+    ).fetchone()[0]
+    return {
+        "services": attendance["services"],
+        "attendance": attendance["attendance"],
+        "total_giving": total_giving,
+        "total_expenses": total_expenses,
+        "balance": total_giving - total_expenses,
+    }
+
+
+@dashboard.route("/reports/rollup")
+@role_required(["admin"])
+def rollup():
+    db = get_read_db()
+    filters = report_filters()
+    # Each branch's totals are cached under that branch, so a write in one branch
+    # only recomputes its own row of the rollup.
+    cache_key = ("rollup", filters["date_from"], filters["date_to"], filters["service_type"])
+    branches = []
+    for tenant in list_tenants(db):
+        totals = tenant_cache.get(tenant["id"], cache_key, lambda: tenant_totals(db, tenant["id"], filters))
+        branches.append(dict(totals, name=tenant["name"]))
+    consolidated = {k: sum(b[k] for b in branches) for k in ROLLUP_TOTALS}
+
+    filter_args = {k: v for k, v in request.args.items() if k in ("date_from", "date_to", "service_type") and v}
+    return render_template("rollup.html", branches=branches, consolidated=consolidated, filter_args=filter_args)
+
+
+# ---------------------------
+# Service History (one row per service)
+# ---------------------------
+def service_history_page(db, filters, cursor=None, limit=REPORT_PAGE_SIZE):
+    """Attendance, giving and approved expenses per (date, service_type) in one statement.
+
+    Each table contributes at most one page of service keys, read in index order
+    (keyset on date, service_type). The totals are grouped only over the branch's
+    rows between the page's first and last date and joined to the page, so the
+    work per page is bounded by the page's date window, not the branch's history.
+    """
+    clauses, params = filter_clauses(filters)
+    if cursor:
+        clauses.append(f"(date, {SERVICE_KEY}) < (?, ?)")
+        params.extend(cursor)
+    expense_clauses = clauses + ["approved=1"]
+
+    def page_keys(table, key_clauses):
+        return (
+            f"SELECT * FROM (SELECT DISTINCT tenant_id, date, {SERVICE_KEY} AS service_type FROM {table}"
+            f"{where_sql(key_clauses)} ORDER BY date DESC, service_type DESC LIMIT ?) {table}_keys"
+        )
+
+    def totals(table, sums, extra=""):
+        return (
+            f"SELECT tenant_id, date, {SERVICE_KEY} AS service_type, {sums} FROM {table}"
+            " WHERE tenant_id = ? AND date >= (SELECT MIN(date) FROM page)"
+            f" AND date <= (SELECT MAX(date) FROM page){extra}"
+            f" GROUP BY tenant_id, date, {SERVICE_KEY}"
+        )
+
+    def joined(alias):
+        return (f"{alias}.tenant_id = p.tenant_id AND {alias}.date = p.date"
+                f" AND {alias}.service_type = p.service_type")
+
+    sql = f"""
+        WITH page AS (
+            SELECT tenant_id, date, service_type FROM (
+                {page_keys("attendance_summary", clauses)}
+                UNION
+                {page_keys("giving_summary", clauses)}
+                UNION
+                {page_keys("expenses", expense_clauses)}
+            ) service_keys
+            ORDER BY date DESC, service_type DESC
+            LIMIT ?
+        )
+        SELECT p.date, p.service_type,
+               COALESCE(att.attendance, 0) AS attendance,
+               COALESCE(gs.giving, 0) AS giving,
+               COALESCE(ex.expenses, 0) AS expenses
+        FROM page p
+        LEFT JOIN ({totals("attendance_summary", "SUM(total) AS attendance")}) att ON {joined("att")}
+        LEFT JOIN ({totals("giving_summary",
+                           "SUM(COALESCE(tithe, 0) + COALESCE(offering, 0) + COALESCE(special, 0)) AS giving")}) gs
+               ON {joined("gs")}
+        LEFT JOIN ({totals("expenses", "SUM(amount) AS expenses", " AND approved = 1")}) ex ON {joined("ex")}
+        ORDER BY p.date DESC, p.service_type DESC
+    """
+    arm_params = params + [limit + 1]
+    rows = db.execute(sql, arm_params * 3 + [limit + 1] + [filters["tenant_id"]] * 3).fetchall()
+
+    history = [{
+        'date': r["date"],
+        'service_type': r["service_type"],
+        'attendance': r["attendance"],
+        'giving': r["giving"],
+        'expenses': r["expenses"],
+        'balance': r["giving"] - r["expenses"],
+    } for r in rows]
+    return _page(history, limit, lambda h: encode_cursor(h["date"], h["service_type"]))
+
+
+@dashboard.route("/service-history")
+@role_required(["admin", "pastor", "usher", "finance"])
+def service_history():
+    db = get_read_db()
+    # The filter form picks a single service date; it bounds both ends of the range.
+    service_date = _parse_date_arg("date")
+    filters = {
+        "tenant_id": current_tenant_id(),
+        "date_from": service_date,
+        "date_to": service_date,
+        "service_type": (request.args.get("service_type") or "").strip().lower() or None,
+    }
+    cursor = decode_cursor(request.args.get("after"))
+    history, next_cursor = service_history_page(db, filters, cursor)
+
+    filter_args = {k: v for k, v in request.args.items() if k in ("date", "service_type") and v}
+    return render_template(
+        "service_history.html",
+        history=history,
+        next_cursor=next_cursor,
+        filter_args=filter_args,
     )
+
+
+# ---------------------------
+# Per-service totals for a whole month (CSV export, period close)
+# ---------------------------
+def compute_service_totals(db, month, tenant_id):
+    """Attendance, giving and approved expenses for every service of one branch in ``month`` (YYYY-MM), one statement."""
+    bounds = [tenant_id, f"{month}-01", f"{month}-31"]
+    month_range = "tenant_id = ? AND date >= ? AND date <= ?"
+    sql = f"""
+        WITH service_keys AS (
+            SELECT date, {SERVICE_KEY} AS service_type FROM attendance_summary WHERE {month_range}
+            UNION
+            SELECT date, {SERVICE_KEY} AS service_type FROM giving_summary WHERE {month_range}
+            UNION
+            SELECT date, {SERVICE_KEY} AS service_type FROM expenses WHERE approved=1 AND {month_range}
+        ),
+        att_totals AS (
+            SELECT date, {SERVICE_KEY} AS service_type, SUM(male) AS male, SUM(female) AS female,
+                   SUM(children) AS children, SUM(total) AS attendance
+            FROM attendance_summary WHERE {month_range}
+            GROUP BY date, {SERVICE_KEY}
+        ),
+        giving_totals AS (
+            SELECT date, {SERVICE_KEY} AS service_type, SUM(tithe) AS tithe, SUM(offering) AS offering,
+                   SUM(special) AS special, COUNT(*) AS giving_entries
+            FROM giving_summary WHERE {month_range}
+            GROUP BY date, {SERVICE_KEY}
+        ),
+        expense_totals AS (
+            SELECT date, {SERVICE_KEY} AS service_type, SUM(amount) AS expenses
+            FROM expenses WHERE approved=1 AND {month_range}
+            GROUP BY date, {SERVICE_KEY}
+        )
+        SELECT k.date, k.service_type,
+               COALESCE(a.male, 0) AS male, COALESCE(a.female, 0) AS female,
+               COALESCE(a.children, 0) AS children, COALESCE(a.attendance, 0) AS attendance,
+               COALESCE(gt.tithe, 0) AS tithe, COALESCE(gt.offering, 0) AS offering,
+               COALESCE(gt.special, 0) AS special, COALESCE(gt.giving_entries, 0) AS giving_entries,
+               COALESCE(e.expenses, 0) AS total_expenses
+        FROM service_keys k
+        LEFT JOIN att_totals a ON a.date = k.date AND a.service_type = k.service_type
+        LEFT JOIN giving_totals gt ON gt.date = k.date AND gt.service_type = k.service_type
+        LEFT JOIN expense_totals e ON e.date = k.date AND e.service_type = k.service_type
+        ORDER BY k.date DESC, k.service_type DESC
+    """
+    services = []
+    for r in db.execute(sql, bounds * 6).fetchall():
+        row = dict(r)
+        row['total_giving'] = row['tithe'] + row['offering'] + row['special']
+        row['balance'] = row['total_giving'] - row['total_expenses']
+        services.append(row)
+    return services
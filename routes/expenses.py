@@ -1,9 +1,11 @@
 
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
-from models import get_db
+from models import get_db, get_read_db, current_tenant_id, is_month_closed, lock_periods, closed_period_message, expense_text_search, claim_submission
+from audit import record
 from forms import ExpenseForm, ApproveExpenseForm
 from datetime import datetime
+from routes.dashboard import filter_clauses, where_sql
 
 expenses_bp = Blueprint('expenses', __name__)
 
@@ -30,11 +32,21 @@ def approve_expenses():
 	if request.method == 'POST' and form.validate_on_submit():
 		expense_id = request.form.get('expense_id')
 		if expense_id:
-			db.execute('UPDATE expenses SET approved=1, approved_by=? WHERE id=?', (current_user.name, expense_id))
-			db.commit()
-			flash(f'Expense approved by {current_user.name}.', 'success')
+			row = db.execute('SELECT date FROM expenses WHERE id=? AND tenant_id=?', (expense_id, current_tenant_id())).fetchone()
+			if row:
+				lock_periods(db, [row['date']])
+			if row and is_month_closed(db, row['date']):
+				flash(closed_period_message(row['date']), 'danger')
+			else:
+				cursor = db.execute('UPDATE expenses SET approved=1, approved_by=? WHERE id=? AND tenant_id=? AND approved=0', (current_user.name, expense_id, current_tenant_id()))
+				db.commit()
+				if cursor.rowcount:
+					record('approve', 'expenses', expense_id)
+					flash(f'Expense approved by {current_user.name}.', 'success')
+				else:
+					flash('Expense not found or already approved.', 'warning')
 		return redirect(url_for('expenses.approve_expenses'))
-	expenses = db.execute('SELECT id, date, service_type, category, amount, payment_method, description, paid_by, approved_by FROM expenses WHERE approved=0').fetchall()
+	expenses = db.execute('SELECT id, date, service_type, category, amount, payment_method, description, paid_by, approved_by FROM expenses WHERE tenant_id=? AND approved=0', (current_tenant_id(),)).fetchall()
 	return render_template('expenses.html', expenses=expenses, form=form)
 
 @expenses_bp.route('/expenses/add', methods=['GET', 'POST'])
@@ -49,19 +61,97 @@ def add_expense():
 		if not service_type:
 			flash("Service Type is required for expense entry.", "danger")
 			return render_template('add_expense.html', form=form)
-		db.execute(
-			"INSERT INTO expenses (date, service_type, category, amount, payment_method, description, paid_by, approved) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
-			(
-				form.date.data,
-				service_type,
-				form.category.data,
-				form.amount.data,
-				form.payment_method.data,
-				form.description.data,
-				current_user.name
+		lock_periods(db, [form.date.data])
+		if is_month_closed(db, form.date.data):
+			flash(closed_period_message(form.date.data), "danger")
+			return render_template('add_expense.html', form=form)
+		saved_message = "Expense added and pending approval."
+		# A retried/double-tapped submit replays the original result instead of inserting again
+		replayed = claim_submission(db, form.idempotency_key.data, saved_message)
+		if replayed is None:
+			db.execute(
+				"INSERT INTO expenses (date, service_type, category, amount, payment_method, description, paid_by, approved, tenant_id) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+				(
+					form.date.data,
+					service_type,
+					form.category.data,
+					form.amount.data,
+					form.payment_method.data,
+					form.description.data,
+					current_user.name,
+					current_tenant_id()
+				)
 			)
-		)
-		db.commit()
-		flash("Expense added and pending approval.", "success")
+			db.commit()
+			record('insert', 'expenses', date=form.date.data, service_type=service_type,
+				category=form.category.data, amount=form.amount.data)
+		flash(replayed or saved_message, "success")
 		return redirect(url_for('dashboard.view_dashboard'))
 	return render_template('add_expense.html', form=form)
+
+SEARCH_PAGE_SIZE = 25
+SEARCH_MAX_PAGE = 200
+
+def _float_arg(name):
+	try:
+		return float(request.args.get(name, ''))
+	except ValueError:
+		return None
+
+def _date_arg(name):
+	value = request.args.get(name, '').strip()
+	try:
+		return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+	except ValueError:
+		return None
+
+# Search expenses (finance, pastor, admin)
+@expenses_bp.route('/expenses/search')
+@login_required
+@role_required(['finance', 'pastor', 'admin'])
+def search_expenses():
+	text = request.args.get('q', '').strip()
+	status = request.args.get('status', 'all')
+	try:
+		page = min(max(int(request.args.get('page', 1)), 1), SEARCH_MAX_PAGE)
+	except ValueError:
+		page = 1
+
+	clauses, params = filter_clauses(
+		{'date_from': _date_arg('date_from'), 'date_to': _date_arg('date_to')}, date_col='e.date'
+	)
+	amount_min, amount_max = _float_arg('amount_min'), _float_arg('amount_max')
+	if amount_min is not None:
+		clauses.append('e.amount >= ?')
+		params.append(amount_min)
+	if amount_max is not None:
+		clauses.append('e.amount <= ?')
+		params.append(amount_max)
+	if status in ('approved', 'pending'):
+		clauses.append('e.approved = ?')
+		params.append(1 if status == 'approved' else 0)
+
+	join, order = '', 'e.date DESC, e.id DESC'
+	if text:
+		# Ranked full-text match (GIN/tsvector on Postgres, FTS5 on SQLite)
+		join, match, rank_order, text_params = expense_text_search(text)
+		clauses.append(match)
+		params.append(text_params[0])
+		order = rank_order + ', ' + order
+		params.extend(text_params[1:])
+
+	results, has_next = [], False
+	if text or clauses:
+		# Always within the current branch
+		clauses.insert(0, 'e.tenant_id = ?')
+		params.insert(0, current_tenant_id())
+		rows = get_read_db().execute(
+			'SELECT e.id, e.date, e.service_type, e.category, e.amount, e.payment_method, e.description, '
+			'e.paid_by, e.approved, e.approved_by FROM expenses e' + join + where_sql(clauses)
+			+ ' ORDER BY ' + order + ' LIMIT ? OFFSET ?',
+			params + [SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE]
+		).fetchall()
+		results, has_next = rows[:SEARCH_PAGE_SIZE], len(rows) > SEARCH_PAGE_SIZE
+
+	search_args = {k: v for k, v in request.args.items() if k != 'page' and v}
+	return render_template('expenses_search.html', results=results, page=page, has_next=has_next, search_args=search_args)
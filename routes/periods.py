@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask_login import login_required, current_user
+from models import get_db, is_month_closed, lock_periods, list_tenants, current_tenant_id, IntegrityError
+from routes.dashboard import role_required, compute_service_totals
+from audit import record
+import archive
+
+periods_bp = Blueprint('periods', __name__)
+
+SNAPSHOT_COLUMNS = (
+    'tenant_id', 'date', 'service_type', 'male', 'female', 'children', 'attendance', 'tithe', 'offering',
+    'special', 'giving_entries', 'total_giving', 'total_expenses', 'balance'
+)
+
+
+# ---------------------------
+# Period close (Finance)
+# ---------------------------
+# Months are closed for the whole organisation at once, so only admins close and
+# reopen them; the snapshot keeps each branch's per-service totals apart and the
+# list shows the current branch's.
+@periods_bp.route('/periods')
+@login_required
+@role_required(['finance', 'admin'])
+def periods_list():
+    db = get_db()
+    closed = db.execute(
+        "SELECT p.month, p.closed_at, p.closed_by, COUNT(s.id) AS services, "
+        "COALESCE(SUM(s.attendance), 0) AS attendance, COALESCE(SUM(s.total_giving), 0) AS total_giving, "
+        "COALESCE(SUM(s.total_expenses), 0) AS total_expenses, COALESCE(SUM(s.balance), 0) AS balance "
+        "FROM period_closes p LEFT JOIN service_snapshots s ON s.month = p.month AND s.tenant_id = ? "
+        "GROUP BY p.month, p.closed_at, p.closed_by ORDER BY p.month DESC",
+        (current_tenant_id(),)
+    ).fetchall()
+    last_month = (datetime.today().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    return render_template('periods.html', closed=closed, last_month=last_month)
+
+
+@periods_bp.route('/periods/close', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def close_period():
+    month = request.form.get('month', '').strip()
+    try:
+        month_start = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        flash("Choose a month to close.", "danger")
+        return redirect(url_for('periods.periods_list'))
+    if month_start >= datetime.today().replace(day=1, hour=0, minute=0, second=0, microsecond=0):
+        flash("Only finished months can be closed.", "danger")
+        return redirect(url_for('periods.periods_list'))
+    if _archived(month):
+        return redirect(url_for('periods.periods_list'))
+
+    db = get_db()
+    # Waits for entries into the month that already passed their closed-month check
+    # and holds off new ones until the close and its snapshot are committed together.
+    lock_periods(db, [month], exclusive=True)
+    if is_month_closed(db, month):
+        db.rollback()
+        flash(f"{month} is already closed.", "warning")
+        return redirect(url_for('periods.periods_list'))
+    try:
+        db.execute(
+            "INSERT INTO period_closes (month, closed_at, closed_by) VALUES (?, ?, ?)",
+            (month, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), current_user.name)
+        )
+        # A close covers every branch; each branch's services are snapshotted separately
+        services = [
+            dict(s, tenant_id=branch['id'])
+            for branch in list_tenants(db)
+            for s in compute_service_totals(db, month, branch['id'])
+        ]
+        if services:
+            db.executemany(
+                f"INSERT INTO service_snapshots (month, {', '.join(SNAPSHOT_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' for _ in SNAPSHOT_COLUMNS)})",
+                [[month] + [s[c] for c in SNAPSHOT_COLUMNS] for s in services]
+            )
+        db.commit()
+        record("close", "period_closes", month, services=len(services))
+        flash(f"{month} closed: {len(services)} service(s) snapshotted.", "success")
+    except IntegrityError:
+        db.rollback()
+        flash(f"{month} is already closed.", "warning")
+    return redirect(url_for('periods.periods_list'))
+
+
+@periods_bp.route('/periods/<month>/reopen', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def reopen_period(month):
+    # An archived (and possibly purged) year has only its snapshots left; never discard them
+    if _archived(month):
+        return redirect(url_for('periods.periods_list'))
+    db = get_db()
+    if not is_month_closed(db, month):
+        flash(f"{month} is not closed.", "warning")
+        return redirect(url_for('periods.periods_list'))
+    db.execute("DELETE FROM service_snapshots WHERE month=?", (month,))
+    db.execute("DELETE FROM period_closes WHERE month=?", (month,))
+    db.commit()
+    record("reopen", "period_closes", month)
+    flash(f"{month} reopened. Reports for it are computed live until it is closed again.", "success")
+    return redirect(url_for('periods.periods_list'))
+
+
+def _archived(month):
+    """Flash and return True when ``month`` belongs to a year written to the archive."""
+    year = month[:4]
+    if year.isdigit() and archive.is_year_archived(archive.archive_dir(current_app), int(year)):
+        flash(f"{year} is archived; its months can no longer be closed or reopened.", "danger")
+        return True
+    return False
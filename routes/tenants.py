@@ -0,0 +1,57 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask_login import login_required
+from models import get_db, list_tenants, tenant_cache, current_tenant_id, IntegrityError
+from routes.dashboard import role_required
+from audit import record
+
+tenants_bp = Blueprint('tenants', __name__)
+
+
+# ---------------------------
+# Branches (Admin)
+# ---------------------------
+@tenants_bp.route('/branches', methods=['GET', 'POST'])
+@login_required
+@role_required(['admin'])
+def branches():
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        if not name:
+            flash("Branch name is required.", "danger")
+        else:
+            db = get_db()
+            try:
+                db.execute("INSERT INTO tenants (name) VALUES (?)", (name,))
+                db.commit()
+                tenant_cache.invalidate(None)
+                record("insert", "tenants", name=name)
+                flash(f"Branch {name} added.", "success")
+            except IntegrityError:
+                db.rollback()
+                flash(f"A branch named {name} already exists.", "danger")
+        return redirect(url_for('tenants.branches'))
+    return render_template('branches.html', branches=list_tenants(), current_id=current_tenant_id())
+
+
+@tenants_bp.route('/branches/switch', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def switch_branch():
+    try:
+        tenant_id = int(request.form.get('tenant_id', ''))
+    except ValueError:
+        tenant_id = None
+    branch = next((b for b in list_tenants() if b['id'] == tenant_id), None)
+    if branch is None:
+        flash("Unknown branch.", "danger")
+    else:
+        session['tenant_id'] = tenant_id
+        flash(f"Now working in {branch['name']}.", "success")
+    return redirect(_local_path(request.form.get('next')) or url_for('dashboard.view_dashboard'))
+
+
+def _local_path(target):
+    """``target`` if it is a path on this site, else None (never redirect off-site)."""
+    if target and target.startswith('/') and not target.startswith('//') and '\\' not in target:
+        return target
+    return None
@@ -0,0 +1,332 @@
+"""Sunday-morning burst load test.
+
+Starts the app in-process on a local port (against a local database by default),
+logs in as the roles seeded by ``seed_default_users`` and replays a weighted mix
+of requests at a fixed concurrency, then reports throughput, latency percentiles,
+error rates and database connection usage.
+
+    python scripts/load_test.py --concurrency 20 --duration 60
+    python scripts/load_test.py --database sqlite:///burst.db --prefill 5000 \\
+        --mix attendance=3,giving=3,expense=1,dashboard=4,reports=2
+    DATABASE_URL=postgresql://... DB_POOL_MAX=20 python scripts/load_test.py
+
+Against Postgres keep DB_POOL_MAX at or above the concurrency plus two (the
+audit writer takes a connection too). Beyond that, requests wait up to
+DB_POOL_TIMEOUT for a connection and then fail with 503, reported as
+"pool exhausted".
+
+Without ``--database`` and with no DATABASE_URL set, a throwaway SQLite file is used.
+
+``--replica URL`` routes read-only pages to a second database (DATABASE_REPLICA_URL).
+With SQLite, point it at a copy of the primary file; a missing or empty file
+exercises the fallback to the primary instead. The report shows how many pages
+each side served.
+"""
+import argparse
+import http.cookiejar
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must match models.DEFAULT_USERS
+ROLE_ACCOUNTS = {
+    "usher": ("usher@church.com", "password123"),
+    "finance": ("finance@church.com", "password123"),
+    "pastor": ("pastor@church.com", "password123"),
+}
+
+DEFAULT_MIX = "attendance=3,giving=3,expense=1,dashboard=4,reports=2"
+SERVICE_TYPES = ["sunday", "midweek", "special"]
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time the request itself; a successful POST answers with a redirect.
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Session:
+    """One logged-in browser session for a role."""
+
+    def __init__(self, base_url, role):
+        self.base_url = base_url
+        self.role = role
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+        self.csrf_token = None
+
+    def request(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            resp = self.opener.open(self.base_url + path, body, timeout=60)
+            return resp.status, resp.headers, resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read().decode("utf-8", "replace")
+
+    def login(self):
+        _, _, html = self.request("/login")
+        self.csrf_token = CSRF_RE.search(html).group(1)
+        email, password = ROLE_ACCOUNTS[self.role]
+        status, headers, _ = self.request(
+            "/login", {"csrf_token": self.csrf_token, "email": email, "password": password}
+        )
+        if status != 302 or "/dashboard" not in headers.get("Location", ""):
+            raise RuntimeError(f"login failed for {self.role} ({status})")
+
+
+def _today_ish():
+    return (date.today() - timedelta(days=random.randint(0, 6))).strftime("%Y-%m-%d")
+
+
+def _attendance(session):
+    return session.request("/attendance", {
+        "csrf_token": session.csrf_token, "date": _today_ish(),
+        "service_type": random.choice(SERVICE_TYPES),
+        "male": random.randint(20, 200), "female": random.randint(20, 200), "children": random.randint(0, 80),
+    })
+
+
+def _giving(session):
+    return session.request("/giving", {
+        "csrf_token": session.csrf_token, "date": _today_ish(),
+        "service_type": random.choice(SERVICE_TYPES),
+        "tithe": round(random.uniform(1000, 50000), 2), "offering": round(random.uniform(500, 20000), 2),
+        "special": round(random.uniform(0, 5000), 2),
+    })
+
+
+def _expense(session):
+    return session.request("/expenses/add", {
+        "csrf_token": session.csrf_token, "date": _today_ish(),
+        "service_type": random.choice(SERVICE_TYPES), "category": random.choice(["fuel", "welfare", "sound"]),
+        "amount": round(random.uniform(500, 30000), 2), "payment_method": "cash",
+        "description": "load test",
+    })
+
+
+def _dashboard(session):
+    return session.request("/dashboard")
+
+
+def _reports(session):
+    return session.request("/reports")
+
+
+# action -> (role, callable, expected success statuses)
+ACTIONS = {
+    "attendance": ("usher", _attendance, (302,)),
+    "giving": ("finance", _giving, (302,)),
+    "expense": ("finance", _expense, (302,)),
+    "dashboard": ("pastor", _dashboard, (200,)),
+    "reports": ("pastor", _reports, (200,)),
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise SystemExit(f"Unknown action in --mix: {name!r} (choose from {', '.join(ACTIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_kinds = defaultdict(int)
+
+    def record(self, action, elapsed, ok, kind=None):
+        with self.lock:
+            self.latencies[action].append(elapsed)
+            if not ok:
+                self.errors[action] += 1
+                self.error_kinds[kind or "other"] += 1
+
+
+def error_kind(status):
+    # The app answers 503 when no pooled DB connection freed up within DB_POOL_TIMEOUT
+    return "pool exhausted" if status == 503 else f"HTTP {status}"
+
+
+def worker(base_url, mix, results, stop_at, remaining):
+    sessions = {}
+    names, weights = list(mix), list(mix.values())
+    while time.time() < stop_at:
+        if remaining is not None:
+            with remaining["lock"]:
+                if remaining["n"] <= 0:
+                    return
+                remaining["n"] -= 1
+        action = random.choices(names, weights)[0]
+        role, fn, ok_statuses = ACTIONS[action]
+        started = time.perf_counter()
+        kind = None
+        try:
+            session = sessions.get(role)
+            if session is None:
+                session = sessions[role] = Session(base_url, role)
+                session.login()
+                started = time.perf_counter()
+            status, headers, _ = fn(session)
+            # role_required bounces to the login page instead of returning 403
+            ok = status in ok_statuses and "/login" not in headers.get("Location", "")
+            kind = None if ok else error_kind(status)
+        except Exception as e:
+            ok, kind = False, type(e).__name__
+        results.record(action, time.perf_counter() - started, ok, kind)
+
+
+def monitor(stop_event, samples):
+    from models import connection_stats
+    while not stop_event.wait(0.25):
+        samples.append(connection_stats()["in_use"])
+
+
+def prefill(rows):
+    """Insert historical rows so reports and aggregates run against realistic volumes."""
+    from models import db_connection
+    start = date.today() - timedelta(days=rows)
+    with db_connection() as db:
+        att, giv, exp = [], [], []
+        for i in range(rows):
+            day = (start + timedelta(days=i)).strftime("%Y-%m-%d")
+            st = SERVICE_TYPES[i % len(SERVICE_TYPES)]
+            m, f, c = random.randint(20, 200), random.randint(20, 200), random.randint(0, 80)
+            att.append((day, st, m, f, c, m + f + c))
+            giv.append((day, st, random.uniform(1000, 50000), random.uniform(500, 20000), 0.0, "Prefill"))
+            exp.append((day, st, "fuel", random.uniform(500, 30000), "cash", "prefill", "Prefill", 1, "Prefill"))
+        db.executemany(
+            "INSERT INTO attendance_summary (date, service_type, male, female, children, total) VALUES (?, ?, ?, ?, ?, ?)",
+            att)
+        db.executemany(
+            "INSERT INTO giving_summary (date, service_type, tithe, offering, special, entered_by) VALUES (?, ?, ?, ?, ?, ?)",
+            giv)
+        db.executemany(
+            "INSERT INTO expenses (date, service_type, category, amount, payment_method, description, paid_by, approved, approved_by) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            exp)
+        db.commit()
+
+
+def report(results, elapsed, samples, concurrency):
+    from models import connection_stats
+    print()
+    print(f"Duration {elapsed:.1f}s at concurrency {concurrency}")
+    print(f"{'action':<12}{'count':>8}{'errors':>8}{'err%':>7}{'rps':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    all_latencies, total_errors = [], 0
+    for action in sorted(results.latencies):
+        lat = sorted(results.latencies[action])
+        errors = results.errors[action]
+        all_latencies.extend(lat)
+        total_errors += errors
+        _print_row(action, lat, errors, elapsed)
+    _print_row("TOTAL", sorted(all_latencies), total_errors, elapsed)
+    if results.error_kinds:
+        print("Errors by kind: " + ", ".join(f"{k} {n}" for k, n in sorted(results.error_kinds.items())))
+
+    stats = connection_stats()
+    print()
+    print(f"DB connections: peak in use {stats['peak_in_use']}, checkouts {stats['checkouts']}"
+          + (f", pool open {stats['pool_open']}/{stats['pool_max']}" if "pool_open" in stats else "")
+          + (f", pool exhausted {stats['pool_exhausted']} time(s)" if stats["pool_exhausted"] else ""))
+    if stats["replica_reads"] or stats["replica_fallbacks"]:
+        print(f"Read replica: {stats['replica_reads']} page(s) served, "
+              f"{stats['replica_fallbacks']} fell back to the primary")
+    if samples:
+        print(f"Sampled in-use connections: avg {sum(samples) / len(samples):.1f}, max {max(samples)}")
+
+
+def _print_row(name, lat, errors, elapsed):
+    count = len(lat)
+    ms = lambda v: f"{v * 1000:.0f}ms"
+    print(f"{name:<12}{count:>8}{errors:>8}{(100.0 * errors / count if count else 0):>6.1f}%"
+          f"{count / elapsed if elapsed else 0:>8.1f}"
+          f"{ms(percentile(lat, 50)):>9}{ms(percentile(lat, 90)):>9}{ms(percentile(lat, 95)):>9}"
+          f"{ms(percentile(lat, 99)):>9}{ms(lat[-1] if lat else 0):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database", help="DATABASE_URL to test against (default: temporary SQLite file)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted action mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--prefill", type=int, default=0, help="historical rows to insert before the run")
+    parser.add_argument("--replica", help="DATABASE_REPLICA_URL for read-only pages (default: none)")
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ["DATABASE_URL"] = args.database
+    elif not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "loadtest.db")
+    os.environ.setdefault("SECRET_KEY", "load-test")
+    if args.replica:
+        os.environ["DATABASE_REPLICA_URL"] = args.replica
+    # Every simulated user logs in from 127.0.0.1, which the per-IP login limit would throttle
+    os.environ.setdefault("LOGIN_THROTTLE_ENABLED", "0")
+    mix = parse_mix(args.mix)
+
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    from app import app
+    from models import seed_default_users
+
+    with app.app_context():
+        seed_default_users()
+    if args.prefill:
+        prefill(args.prefill)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"Target {base_url} ({os.environ['DATABASE_URL'].split('@')[-1]}), mix {mix}")
+
+    results, samples, stop_event = Results(), [], threading.Event()
+    remaining = {"n": args.requests, "lock": threading.Lock()} if args.requests else None
+    stop_at = time.time() + (args.duration if not args.requests else 10 ** 9)
+    threading.Thread(target=monitor, args=(stop_event, samples), daemon=True).start()
+
+    started = time.time()
+    threads = [threading.Thread(target=worker, args=(base_url, mix, results, stop_at, remaining))
+               for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+    stop_event.set()
+    server.shutdown()
+
+    report(results, elapsed, samples, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
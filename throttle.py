@@ -0,0 +1,244 @@
+"""Login throttling with per-IP and per-account token buckets.
+
+Every login POST takes one token from the client IP's bucket. Failed password
+checks also take one from two account buckets: one for the submitted email from
+that IP, and a looser one for the email from anywhere. An attempt is rejected
+with 429 before the user is looked up or a password hash is checked when the IP
+bucket or either account bucket is empty. Because only failures drain the
+account buckets, somebody who does not know the password cannot lock its owner
+out from another address; the account-wide cap only stops guessing spread over
+many addresses. A successful login refills the (account, IP) bucket.
+
+Buckets live in a compact in-process LRU map (LOGIN_THROTTLE_MAX_KEYS). A key
+that is missing counts as a full bucket, so eviction can only make throttling
+more lenient; it never locks anyone out. Set LOGIN_THROTTLE_REDIS_URL to share
+buckets between workers and hosts (needs the ``redis`` package). If Redis is
+unreachable, the in-process buckets are used instead.
+
+Settings: LOGIN_THROTTLE_ENABLED (default on), LOGIN_IP_BURST / LOGIN_IP_PER_MINUTE,
+LOGIN_ACCOUNT_BURST / LOGIN_ACCOUNT_PER_MINUTE (failures per account and IP),
+LOGIN_ACCOUNT_TOTAL_BURST / LOGIN_ACCOUNT_TOTAL_PER_MINUTE (failures per account),
+TRUSTED_PROXY_COUNT.
+
+The IP buckets key on the client address. Behind a reverse proxy (Render,
+nginx, a load balancer) every request comes from the proxy's address, so all
+clients would share one IP bucket. Set TRUSTED_PROXY_COUNT to the number of
+proxies in front of the app: the client address is then read from that many
+X-Forwarded-For hops (werkzeug's ProxyFix). Leave it at 0 when clients connect
+directly; otherwise anyone could pick their own address with a forged header.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+logger = logging.getLogger(__name__)
+_limiter = None
+TOP_KEYS_KEPT = 1000
+
+
+class MemoryBuckets:
+    """Token buckets keyed by string, bounded to ``max_keys`` least-recently-used entries."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, limits, now):
+        """Take ``cost`` tokens from every ``(key, capacity, per_second, cost)`` bucket, or none.
+
+        Every bucket must hold at least one token (a cost of 0 only checks that).
+        Returns (index of the first empty bucket or None, seconds until it has a token).
+        """
+        with self._lock:
+            levels = []
+            for i, (key, capacity, rate, _) in enumerate(limits):
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    return i, (1 - tokens) / rate
+                levels.append(tokens)
+            for (key, _, _, cost), tokens in zip(limits, levels):
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return None, 0.0
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Same algorithm as MemoryBuckets.take, atomically inside Redis.
+# KEYS: bucket keys; ARGV: now, then capacity, per-second rate and cost for each key.
+_REDIS_TAKE = """
+local now = tonumber(ARGV[1])
+local levels = {}
+for i = 1, #KEYS do
+    local capacity, rate = tonumber(ARGV[3 * i - 1]), tonumber(ARGV[3 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1 then
+        return {i, tostring((1 - tokens) / rate)}
+    end
+    levels[i] = tokens
+end
+for i = 1, #KEYS do
+    local capacity, rate, cost = tonumber(ARGV[3 * i - 1]), tonumber(ARGV[3 * i]), tonumber(ARGV[3 * i + 1])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - cost), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 1)
+end
+return {0, '0'}
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared through Redis; keys expire once they would be full again."""
+
+    prefix = "login-throttle:"
+
+    def __init__(self, url):
+        import redis  # optional dependency, only needed for a shared backend
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._take = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, limits, now):
+        args = [now]
+        for _, capacity, rate, cost in limits:
+            args += [capacity, rate, cost]
+        index, wait = self._take(keys=[self.prefix + key for key, _, _, _ in limits], args=args)
+        return (int(index) - 1 if int(index) else None), float(wait)
+
+    def reset(self, key):
+        self._client.delete(self.prefix + key)
+
+
+class LoginThrottle:
+    def __init__(self, ip_burst, ip_per_minute, account_burst, account_per_minute,
+                 account_total_burst, account_total_per_minute, max_keys, redis_url=None):
+        self.ip_limit = (ip_burst, ip_per_minute / 60.0)
+        self.account_ip_limit = (account_burst, account_per_minute / 60.0)
+        self.account_limit = (account_total_burst, account_total_per_minute / 60.0)
+        self.memory = MemoryBuckets(max_keys)
+        self.shared = RedisBuckets(redis_url) if redis_url else None
+        self._lock = threading.Lock()
+        self.stats = {"allowed": 0, "rejected_ip": 0, "rejected_account": 0, "failed": 0, "backend_errors": 0}
+        self.rejected_keys = Counter()
+
+    def _count(self, key, rejected_key=None):
+        with self._lock:
+            self.stats[key] += 1
+            if rejected_key:
+                self.rejected_keys[rejected_key] += 1
+                if len(self.rejected_keys) > TOP_KEYS_KEPT:
+                    self.rejected_keys = Counter(dict(self.rejected_keys.most_common(TOP_KEYS_KEPT // 2)))
+
+    def _take(self, limits):
+        try:
+            return (self.shared or self.memory).take(limits, time.time())
+        except Exception as e:
+            self._count("backend_errors")
+            logger.warning("Shared login throttle unavailable, using in-process buckets: %s", e)
+            return self.memory.take(limits, time.time())
+
+    def _account_limits(self, ip, account, cost):
+        return [
+            (f"account-ip:{account}|{ip}", *self.account_ip_limit, cost),
+            ("account:" + account, *self.account_limit, cost),
+        ]
+
+    def check(self, ip, account):
+        """Seconds to wait before retrying, or 0 when the attempt may go ahead.
+
+        Takes an IP token; the account buckets are only checked here and are
+        charged by ``failed``.
+        """
+        limits = [("ip:" + ip, *self.ip_limit, 1)]
+        if account:
+            limits += self._account_limits(ip, account, 0)
+        blocked, wait = self._take(limits)
+        if blocked is None:
+            self._count("allowed")
+            return 0
+        kind = "rejected_ip" if blocked == 0 else "rejected_account"
+        self._count(kind, limits[blocked][0])
+        return max(1, int(wait + 0.999))
+
+    def failed(self, ip, account):
+        self._count("failed")
+        if account:
+            self._take(self._account_limits(ip, account, 1))
+
+    def succeeded(self, ip, account):
+        key = f"account-ip:{account}|{ip}"
+        try:
+            (self.shared or self.memory).reset(key)
+        except Exception:
+            self._count("backend_errors")
+        self.memory.reset(key)
+
+
+def init_throttle(app):
+    global _limiter
+    env = os.environ.get
+    app.config.setdefault("LOGIN_THROTTLE_ENABLED", env("LOGIN_THROTTLE_ENABLED", "1") == "1")
+    app.config.setdefault("LOGIN_IP_BURST", int(env("LOGIN_IP_BURST", 20)))
+    app.config.setdefault("LOGIN_IP_PER_MINUTE", float(env("LOGIN_IP_PER_MINUTE", 10)))
+    app.config.setdefault("LOGIN_ACCOUNT_BURST", int(env("LOGIN_ACCOUNT_BURST", 5)))
+    app.config.setdefault("LOGIN_ACCOUNT_PER_MINUTE", float(env("LOGIN_ACCOUNT_PER_MINUTE", 1)))
+    app.config.setdefault("LOGIN_ACCOUNT_TOTAL_BURST", int(env("LOGIN_ACCOUNT_TOTAL_BURST", 50)))
+    app.config.setdefault("LOGIN_ACCOUNT_TOTAL_PER_MINUTE", float(env("LOGIN_ACCOUNT_TOTAL_PER_MINUTE", 10)))
+    app.config.setdefault("LOGIN_THROTTLE_MAX_KEYS", int(env("LOGIN_THROTTLE_MAX_KEYS", 50000)))
+    app.config.setdefault("LOGIN_THROTTLE_REDIS_URL", env("LOGIN_THROTTLE_REDIS_URL"))
+    app.config.setdefault("TRUSTED_PROXY_COUNT", int(env("TRUSTED_PROXY_COUNT", 0)))
+    if app.config["TRUSTED_PROXY_COUNT"] > 0:
+        # request.remote_addr becomes the client address the trusted proxies forwarded
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXY_COUNT"])
+    if not app.config["LOGIN_THROTTLE_ENABLED"]:
+        _limiter = None
+        return
+    _limiter = LoginThrottle(
+        app.config["LOGIN_IP_BURST"], app.config["LOGIN_IP_PER_MINUTE"],
+        app.config["LOGIN_ACCOUNT_BURST"], app.config["LOGIN_ACCOUNT_PER_MINUTE"],
+        app.config["LOGIN_ACCOUNT_TOTAL_BURST"], app.config["LOGIN_ACCOUNT_TOTAL_PER_MINUTE"],
+        app.config["LOGIN_THROTTLE_MAX_KEYS"], app.config["LOGIN_THROTTLE_REDIS_URL"],
+    )
+
+
+def check_login(ip, email):
+    """Seconds the client must wait before another login attempt (0 = go ahead)."""
+    if _limiter is None:
+        return 0
+    return _limiter.check(ip or "unknown", (email or "").strip().lower())
+
+
+def login_failed(ip, email):
+    """Charge the account buckets for a wrong password (or unknown email)."""
+    if _limiter is not None:
+        _limiter.failed(ip or "unknown", (email or "").strip().lower())
+
+
+def login_succeeded(ip, email):
+    if _limiter is not None:
+        _limiter.succeeded(ip or "unknown", (email or "").strip().lower())
+
+
+def throttle_stats(top=20):
+    if _limiter is None:
+        return None
+    with _limiter._lock:
+        stats = dict(_limiter.stats)
+        stats["top_rejected"] = _limiter.rejected_keys.most_common(top)
+    stats["tracked_keys"] = len(_limiter.memory)
+    stats["shared"] = _limiter.shared is not None
+    return stats